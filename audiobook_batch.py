@@ -0,0 +1,350 @@
+"""Headless batch conversion of many PDFs.
+
+    python -m audiobook_batch ~/books/*.pdf --engine Edge --output ~/audiobooks
+    python -m audiobook_batch ~/books --recursive --workers 4 --merge
+
+Each PDF is converted in its own worker process, so a crash or hang in one
+book never takes down the rest of the batch. A JSON summary report is
+written to the output directory. ``main`` can also be registered as a console script.
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+from collections import deque
+
+from book_voice_studio import (
+    BOOK_FORMATS, DEFAULT_TTS_CONCURRENCY, ONLINE_RATE_LIMITS, PDFToAudiobook, normalize_engine_name,
+)
+
+
+def find_pdfs(inputs, recursive=False):
+    """Expand files, directories and glob patterns into a sorted list of PDFs"""
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*.pdf") if recursive else os.path.join(item, "*.pdf")
+            matches = glob.glob(pattern, recursive=recursive)
+        else:
+            matches = glob.glob(item, recursive=recursive) or [item]
+        for path in matches:
+            if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                found.add(os.path.abspath(path))
+    return sorted(found)
+
+
+def parse_chapter_selection(spec):
+    """"1,3-5" (1-based, as listed by --list-chapters) -> sorted 0-based indexes"""
+    selected = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        first, last = int(first), int(last or first)
+        if first < 1 or last < first:
+            raise argparse.ArgumentTypeError(f"invalid chapter range {part!r} (chapters start at 1)")
+        selected.update(range(first - 1, last))
+    return sorted(selected)
+
+
+def convert_one(pdf_path, options):
+    """Convert a single PDF; runs inside a worker process"""
+    started = time.perf_counter()
+    pdf_filename = os.path.splitext(os.path.basename(pdf_path))[0]
+    result = {
+        "pdf": pdf_path,
+        "status": "failed",
+        "chapters": 0,
+        "outputs": [],
+        "merged": None,
+        "job_id": None,
+        "error": None,
+    }
+    errors = []  # user-facing error notices, e.g. why the book export failed
+
+    def collect(level, message):
+        if level == "error":
+            errors.append(message)
+
+    converter = PDFToAudiobook(
+        concurrency=options.get("concurrency"),
+        cache_dir=options.get("cache_dir"),
+        extract_workers=options.get("extract_workers", 1),
+        message_callback=collect,
+    )
+    converter.ocr_workers = options.get("ocr_workers", 1)
+    converter.ocr_enabled = options.get("ocr", True)
+    converter.script_dir = options["output_dir"]
+    converter.audio_merger.memory_budget_mb = options.get("memory_budget_mb")
+    converter.workspace_quota_mb = options.get("workspace_quota_mb")
+    # This worker's share of the engine's request budget
+    converter.rate_limits.update(options.get("rate_limits") or {})
+    try:
+        audio_files = converter.process_chapters_fast(
+            pdf_path,
+            options.get("voice_sample"),
+            tts_method=options["engine"],
+            voice_settings=options.get("voice_settings"),
+            pdf_filename=pdf_filename,
+            selected_chapters=options.get("chapters"),
+        )
+        result["job_id"] = converter.last_job_id
+        result["chapters"] = len(audio_files)
+        result["outputs"] = [audio_file['saved_path'] for audio_file in audio_files]
+        # Chunks the engine still refused after retries (those chapters are incomplete)
+        result["failed_chunks"] = converter.last_failed_chunks
+        book_format = options.get("format", "mp3")
+        book_error = None
+        if (book_format != "mp3" and audio_files) or (options.get("merge") and len(audio_files) > 1):
+            # Written in a scratch directory; the converter publishes it to output_dir
+            scratch = converter.workspace().job()
+            try:
+                if book_format != "mp3":
+                    # One M4B/Opus file with chapter markers, encoded once
+                    merged = converter.export_audiobook(
+                        audio_files, scratch.temp_path(BOOK_FORMATS[book_format]["extension"], prefix="book_"),
+                        pdf_filename, book_format=book_format,
+                    )
+                else:
+                    merged = converter.merge_audio_files_fast(
+                        audio_files, scratch.temp_path(".mp3", prefix="book_"), pdf_filename
+                    )
+            finally:
+                scratch.cleanup()
+            if merged:
+                result["merged"] = converter.last_export_path
+            else:
+                book_error = errors[-1] if errors else f"{book_format} export failed"
+            result["merge_stats"] = converter.last_merge_stats
+        if book_error:
+            # The requested book file is missing even if the chapters are fine
+            result["error"] = book_error
+        elif converter.last_failed_chunks:
+            # Chapters with failed chunks are left out: the book is truncated
+            result["status"] = "partial" if audio_files else "failed"
+            result["error"] = (f"{len(converter.last_failed_chunks)} chunk(s) failed after retries; "
+                               f"job {converter.last_job_id} can be resumed")
+        elif audio_files:
+            result["status"] = "ok"
+        elif converter.last_pipeline.stage_stats()["synthesize"]["items"]:
+            result["error"] = "no chapter audio was produced (TTS failed)"
+        else:
+            result["status"] = "empty"  # no extractable text
+    except Exception as e:
+        result["job_id"] = converter.last_job_id
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        converter.close()
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["metrics"] = converter.metrics.snapshot()
+    if options.get("metrics_dir"):
+        with open(os.path.join(options["metrics_dir"], f"{pdf_filename}.prom"), "w", encoding="utf-8") as f:
+            f.write(converter.metrics.to_prometheus())
+    return result
+
+
+def _failed_result(pdf_path, error):
+    return {"pdf": pdf_path, "status": "failed", "chapters": 0, "outputs": [], "merged": None,
+            "job_id": None, "error": error, "seconds": None}
+
+
+def _worker_main(conn, pdf_path, options):
+    try:
+        result = convert_one(pdf_path, options)
+    except BaseException as e:
+        result = _failed_result(pdf_path, f"{type(e).__name__}: {e}")
+    conn.send(result)
+    conn.close()
+
+
+def run_batch(pdf_paths, options, workers=1, progress=None, timeout=None):
+    """Convert pdf_paths with up to `workers` processes; returns one result per PDF.
+
+    Every PDF gets a fresh process, so a crash, leak or hang in one book is
+    isolated from the others. PDFs running longer than `timeout` seconds
+    are terminated and reported as failed.
+    """
+    context = multiprocessing.get_context()
+    waiting = deque(pdf_paths)
+    running = {}  # result pipe -> (process, pdf_path, start time)
+    results = {}
+
+    def finish(pdf_path, result):
+        results[pdf_path] = result
+        if progress:
+            progress(result)
+
+    while waiting or running:
+        while waiting and len(running) < max(1, workers):
+            pdf_path = waiting.popleft()
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_worker_main, args=(sender, pdf_path, options),
+                                      name=f"audiobook-{os.path.basename(pdf_path)}")
+            process.start()
+            sender.close()
+            running[receiver] = (process, pdf_path, time.monotonic())
+
+        for receiver in multiprocessing.connection.wait(list(running), timeout=1.0):
+            process, pdf_path, _ = running.pop(receiver)
+            try:
+                result = receiver.recv()
+            except EOFError:
+                process.join()
+                result = _failed_result(pdf_path, f"worker exited with code {process.exitcode}")
+            receiver.close()
+            process.join()
+            finish(pdf_path, result)
+
+        if timeout:
+            now = time.monotonic()
+            for receiver, (process, pdf_path, started) in list(running.items()):
+                if now - started > timeout:
+                    process.terminate()
+                    process.join()
+                    receiver.close()
+                    del running[receiver]
+                    finish(pdf_path, _failed_result(pdf_path, f"timed out after {timeout}s"))
+
+    return [results[pdf_path] for pdf_path in pdf_paths]
+
+
+def write_report(results, output_dir, started_at, elapsed):
+    """Write the batch summary as JSON and return its path"""
+    report = {
+        "started": started_at,
+        "seconds": round(elapsed, 3),
+        "total": len(results),
+        "succeeded": sum(1 for result in results if result["status"] == "ok"),
+        "partial": sum(1 for result in results if result["status"] == "partial"),
+        "empty": sum(1 for result in results if result["status"] == "empty"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "results": results,
+    }
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = os.path.join(output_dir, f"batch_report_{timestamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="audiobook_batch",
+        description="Convert PDFs to audiobooks without the Streamlit UI.",
+    )
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", default="audiobooks", help="output directory (default: ./audiobooks)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="search directories recursively")
+    parser.add_argument("-e", "--engine", default="gTTS", choices=["Edge", "gTTS", "pyttsx3"],
+                        help="TTS engine (default: gTTS)")
+    parser.add_argument("--voice", default="en-US-AriaNeural", help="Edge TTS voice")
+    parser.add_argument("--language", default="en", help="gTTS language")
+    parser.add_argument("--rate", type=int, default=180, help="pyttsx3 speech rate")
+    parser.add_argument("--voice-sample", help="voice sample for volume matching")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="PDFs converted in parallel (default: CPU count)")
+    parser.add_argument("--tts-concurrency", type=int, help="chunks synthesized at once per PDF")
+    parser.add_argument("--extract-workers", type=int, default=1, help="extraction processes per PDF")
+    parser.add_argument("--ocr-workers", type=int, default=1, help="OCR processes per PDF")
+    parser.add_argument("--no-ocr", action="store_true", help="skip OCR of scanned pages")
+    parser.add_argument("--cache-dir", help="cache root (TTS chunks, OCR, jobs)")
+    parser.add_argument("--chapters", type=parse_chapter_selection,
+                        help="only convert these chapters, e.g. 1,3-5 (others are never extracted)")
+    parser.add_argument("--list-chapters", action="store_true",
+                        help="print each PDF's chapter index (outline or headings) and exit")
+    parser.add_argument("--merge", action="store_true", help="also write one merged MP3 per PDF")
+    parser.add_argument("-f", "--format", default="mp3", choices=["mp3"] + sorted(BOOK_FORMATS),
+                        help="m4b/opus: also write one book file with chapter markers (needs ffmpeg)")
+    parser.add_argument("--memory-budget-mb", type=float,
+                        help="cap memory used to assemble audio (MB per PDF); peak is reported")
+    parser.add_argument("--workspace-quota-mb", type=float,
+                        help="disk quota for job scratch files under the cache dir (MB)")
+    parser.add_argument("--metrics-dir", help="also write a Prometheus text file per PDF here")
+    parser.add_argument("--timeout", type=float, help="give up on a PDF after this many seconds")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    pdf_paths = find_pdfs(args.inputs, args.recursive)
+    if not pdf_paths:
+        print("No PDFs found.", file=sys.stderr)
+        return 2
+
+    if args.list_chapters:
+        converter = PDFToAudiobook(cache_dir=args.cache_dir)
+        for pdf_path in pdf_paths:
+            print(pdf_path)
+            for entry in converter.chapter_index(pdf_path):
+                print(f"  {entry['index'] + 1:>3}. {entry['title']} (pages {entry['start'] + 1}-{entry['stop']})")
+        return 0
+
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    engine = normalize_engine_name(args.engine)
+    # Every worker process has its own converter, so per-engine budgets are
+    # split between the PDFs converted at once
+    parallel = max(1, min(args.workers, len(pdf_paths)))
+    tts_concurrency = args.tts_concurrency
+    if engine == "pyttsx3" and not tts_concurrency:
+        # Share the cores
+        tts_concurrency = max(1, (os.cpu_count() or 1) // parallel)
+    elif engine in ONLINE_RATE_LIMITS and not tts_concurrency:
+        # Share the requests in flight
+        tts_concurrency = max(1, DEFAULT_TTS_CONCURRENCY[engine] // parallel)
+    rate_limits = None
+    if engine in ONLINE_RATE_LIMITS:
+        # Share the request rate and burst
+        limit = ONLINE_RATE_LIMITS[engine]
+        rate_limits = {engine: dict(limit, rate=limit["rate"] / parallel,
+                                    burst=max(1, limit["burst"] // parallel))}
+    options = {
+        "engine": engine,
+        "voice_settings": {"edge_voice": args.voice, "language": args.language, "rate": args.rate},
+        "voice_sample": args.voice_sample,
+        "concurrency": {engine: tts_concurrency} if tts_concurrency else None,
+        "rate_limits": rate_limits,
+        "extract_workers": args.extract_workers,
+        "ocr_workers": args.ocr_workers,
+        "ocr": not args.no_ocr,
+        "cache_dir": args.cache_dir,
+        "output_dir": output_dir,
+        "merge": args.merge,
+        "chapters": args.chapters,
+        "format": args.format,
+        "memory_budget_mb": args.memory_budget_mb,
+        "workspace_quota_mb": args.workspace_quota_mb,
+        "metrics_dir": args.metrics_dir,
+    }
+    if args.metrics_dir:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+
+    def progress(result):
+        line = f"[{result['status']:>7}] {os.path.basename(result['pdf'])}: {result['chapters']} chapter(s)"
+        if result.get("failed_chunks"):
+            line += f", {len(result['failed_chunks'])} failed chunk(s)"
+        if result.get("error"):
+            line += f" - {result['error']}"
+        print(line, flush=True)
+
+    started_at = datetime.datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    print(f"Converting {len(pdf_paths)} PDF(s) with {engine} using {args.workers} worker(s)...")
+    results = run_batch(pdf_paths, options, workers=args.workers, progress=progress, timeout=args.timeout)
+    report_path = write_report(results, output_dir, started_at, time.perf_counter() - started)
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    partial = sum(1 for result in results if result["status"] == "partial")
+    print(f"Done: {len(results) - failed - partial} converted, {partial} partial, {failed} failed. "
+          f"Report: {report_path}")
+    return 1 if failed or partial else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
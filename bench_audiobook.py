@@ -0,0 +1,492 @@
+"""Benchmarks for the conversion hot paths, fully offline.
+
+    python bench_audiobook.py                       # 100-page book, print a table
+    python bench_audiobook.py --pages 500 --scanned 0.1 --json bench.json
+    python bench_audiobook.py --json new.json --compare bench.json
+    python bench_audiobook.py --http --server-rate 20 --server-errors 0.05 --latency 0.05
+
+A synthetic PDF (text pages plus optional scanned-style image pages) is
+written with a tiny built-in PDF writer, and a deterministic stub TTS engine
+emits silent MP3s whose duration matches normal speaking speed. Every stage
+reports wall time, throughput (pages/s, chars/s, audio-minutes/s) and peak
+RSS; --json writes the same numbers for comparing runs. With --http the
+stub engine is served by a local stand-in TTS server that adds latency and
+throttles (HTTP 429) or fails requests, which exercises the online engines'
+rate limiting, retries and adaptive concurrency.
+"""
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import zlib
+from collections import Counter
+
+import book_voice_studio as bvs
+
+# Normal narration speed, used to size the stub engine's silent audio
+STUB_CHARS_PER_SECOND = 15.0
+
+# Stub output format: MPEG-2 Layer III, 24 kHz mono, 48 kbps (like Edge TTS)
+_STUB_HEADER = bytes((0xFF, 0xE0 | (2 << 3) | (1 << 1) | 1, (6 << 4) | (1 << 2), 3 << 6))
+
+_WORDS = ("the of and to in is was that for on with as by at from his her they this which "
+          "narrative chapter evening river garden silence letter morning journey question "
+          "remember window promise shadow harbor lantern stranger whisper").split()
+
+
+# -- synthetic input ------------------------------------------------------
+
+def _pdf_text(value):
+    return value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _page_lines(rng, page_num, title=None):
+    lines = [f"Synthetic Book - page {page_num + 1}"]  # running header
+    if title:
+        lines.append(title)
+    for _ in range(40):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(9, 14))]
+        lines.append(" ".join(words).capitalize() + ".")
+    lines.append(str(page_num + 1))  # page number footer
+    return lines
+
+
+def _scan_image(rng, width=850, height=1100):
+    """Grayscale 'scan': white paper with dark bars where text lines would be"""
+    rows = []
+    for y in range(height):
+        in_line = 100 <= y < height - 100 and (y - 100) % 24 < 10
+        if in_line:
+            start = 90 + rng.randint(0, 10)
+            stop = width - 90 - rng.randint(0, 200)
+            rows.append(b"\xf0" * start + b"\x30" * (stop - start) + b"\xf0" * (width - stop))
+        else:
+            rows.append(b"\xf0" * width)
+    return zlib.compress(b"".join(rows), 6), width, height
+
+
+def write_synthetic_pdf(path, pages=100, pages_per_chapter=10, scanned_ratio=0.0, seed=1):
+    """Write a Letter-size PDF; every pages_per_chapter pages start a 'Chapter N'.
+
+    A scanned_ratio share of pages is image-only (no text layer), as in a
+    scanned book. Returns the number of characters in the text layer.
+    """
+    rng = random.Random(seed)
+    objects = []  # bodies; object number = index + 1
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)  # filled in once all pages exist
+    scan_data, scan_w, scan_h = _scan_image(rng)
+    image_id = add(
+        f"<< /Type /XObject /Subtype /Image /Width {scan_w} /Height {scan_h} /ColorSpace /DeviceGray "
+        f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(scan_data)} >>\nstream\n".encode()
+        + scan_data + b"\nendstream"
+    )
+
+    text_chars = 0
+    page_ids = []
+    for page_num in range(pages):
+        if page_num and rng.random() < scanned_ratio:
+            content = b"q 612 0 0 792 0 0 cm /Scan Do Q"
+        else:
+            title = f"Chapter {page_num // pages_per_chapter + 1}" if page_num % pages_per_chapter == 0 else None
+            lines = _page_lines(rng, page_num, title)
+            text_chars += sum(len(line) + 1 for line in lines)
+            body = "".join(f"({_pdf_text(line)}) '\n" for line in lines)
+            content = f"BT /F1 9 Tf 11 TL 54 760 Td\n{body}ET".encode("latin-1")
+        content_id = add(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> /XObject << /Scan {image_id} 0 R >> >> >>".encode()
+        ))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    catalog_id = add(f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode())
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root {catalog_id} 0 R >>\n"
+                f"startxref\n{xref}\n%%EOF\n".encode())
+    return text_chars
+
+
+# -- stub engine ----------------------------------------------------------
+
+class StubTTSEngine:
+    """Deterministic offline TTS: silent MP3 sized like real speech.
+
+    ``latency`` adds a fixed per-request delay (seconds) to imitate a
+    network engine.
+    """
+
+    def __init__(self, latency=0.0, chars_per_second=STUB_CHARS_PER_SECOND):
+        self.latency = latency
+        self.chars_per_second = chars_per_second
+        info = bvs.parse_mp3_header(_STUB_HEADER)
+        self.frame = bvs.make_silent_mp3_frame(info)
+        self.seconds_per_frame = info.samples / info.sample_rate
+
+    def __call__(self, text, output_path, voice_settings=None):
+        if self.latency:
+            time.sleep(self.latency)
+        frames = max(1, int(len(text) / self.chars_per_second / self.seconds_per_frame))
+        with open(output_path, "wb") as f:
+            f.write(self.frame * frames)
+        return True
+
+
+class StandInTTSServer(http.server.ThreadingHTTPServer):
+    """Local HTTP stand-in for an online TTS service.
+
+    ``POST /synthesize`` with the chunk text returns the stub engine's MP3
+    after ``latency`` seconds. Requests beyond ``rate`` per second (burst
+    ``burst``) get 429 with a Retry-After header; ``throttle_share`` and
+    ``error_share`` of the rest randomly get 429 or 500.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, rate=None, burst=None, throttle_share=0.0, error_share=0.0, seed=1):
+        super().__init__(("127.0.0.1", 0), _StandInHandler)
+        self.engine = StubTTSEngine()
+        self.latency = latency
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.throttle_share = throttle_share
+        self.error_share = error_share
+        self.rng = random.Random(seed)
+        self.counts = Counter()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/synthesize"
+
+    def admit(self):
+        """HTTP status for the next request"""
+        with self._lock:
+            now = time.monotonic()
+            status = 200
+            if self.rate:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens < 1:
+                    status = 429
+                else:
+                    self._tokens -= 1
+            roll = self.rng.random()
+            if status == 200 and roll < self.throttle_share:
+                status = 429
+            elif status == 200 and roll < self.throttle_share + self.error_share:
+                status = 500
+            self.counts[status] += 1
+            return status
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
+        self.server_close()
+        return False
+
+
+class _StandInHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        text = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        status = server.admit()
+        if status != 200:
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0.2")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        frames = max(1, int(len(text) / server.engine.chars_per_second / server.engine.seconds_per_frame))
+        body = server.engine.frame * frames
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPTTSEngine:
+    """Online engine for the stand-in server; raises urllib's HTTPError on 429/500"""
+
+    def __init__(self, url, timeout=30):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, text, output_path, voice_settings=None):
+        request = urllib.request.Request(self.url, data=text.encode("utf-8"), method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            audio = response.read()
+        with open(output_path, "wb") as f:
+            f.write(audio)
+        return True
+
+
+def mp3_seconds(path):
+    """Audio duration from frame headers (no decode)"""
+    return sum(info.samples / info.sample_rate for info, _ in bvs.iter_mp3_frames(path))
+
+
+# -- measurement ----------------------------------------------------------
+
+class Stage:
+    """Times a block and samples RSS in the background while it runs.
+
+    Volume metrics (pages, chars, chunks, audio_minutes) passed to add()
+    get a matching per-second rate; add() may be called after the block so
+    that measuring the output doesn't count towards the stage's time.
+    """
+
+    RATE_KEYS = ("pages", "chars", "chunks", "audio_minutes")
+
+    def __init__(self, name, results, interval=0.01):
+        self.name = name
+        self.results = results
+        self.interval = interval
+        self.peak_rss = 0
+        self.seconds = None
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, bvs.process_rss() or 0)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_rss = bvs.process_rss() or 0
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        self.results[self.name] = {"seconds": round(self.seconds, 4),
+                                   "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1)}
+        return False
+
+    def add(self, **metrics):
+        entry = self.results[self.name]
+        for key, value in metrics.items():
+            entry[key] = value
+            if key in self.RATE_KEYS and self.seconds:
+                entry[f"{key}_per_s"] = round(value / self.seconds, 2)
+
+
+# -- benchmark ------------------------------------------------------------
+
+def run_benchmarks(args, workdir, server=None):
+    results = {}
+    pdf_path = os.path.join(workdir, "synthetic.pdf")
+    text_chars = write_synthetic_pdf(pdf_path, args.pages, args.pages_per_chapter, args.scanned, args.seed)
+
+    converter = bvs.PDFToAudiobook(cache_dir=os.path.join(workdir, "cache"), cache_size_mb=0,
+                                   extract_workers=args.extract_workers)
+    converter.script_dir = os.path.join(workdir, "out")
+    os.makedirs(converter.script_dir, exist_ok=True)
+    converter.ocr_enabled = args.ocr
+    converter.audio_merger.memory_budget_mb = args.memory_budget_mb
+    chunk_profile = bvs.CHUNK_PROFILES.get(args.chunk_profile)
+    if server is not None:
+        converter.register_engine("Stub", HTTPTTSEngine(server.url), concurrency=args.tts_concurrency,
+                                  chunk_profile=chunk_profile,
+                                  rate_limit={"rate": args.rate_limit, "burst": args.rate_limit,
+                                              "retries": args.retries, "backoff": 0.05, "max_backoff": 2.0})
+    else:
+        converter.register_engine("Stub", StubTTSEngine(latency=args.latency), concurrency=args.tts_concurrency,
+                                  chunk_profile=chunk_profile)
+
+    with Stage("extract", results) as stage:
+        chapters = converter.extract_text_from_pdf(pdf_path)
+    stage.add(pages=args.pages, chars=sum(len(ch['content']) for ch in chapters), chapters=len(chapters),
+              boilerplate_chars_removed=(converter.last_boilerplate_stats or {}).get("chars_removed", 0))
+
+    with Stage("clean", results) as stage:
+        cleaned = [converter.clean_text_fast(ch['content']) for ch in chapters]
+    stage.add(chars=sum(len(ch['content']) for ch in chapters))
+
+    with Stage("split", results) as stage:
+        split = [converter.chunk_text(text, "Stub") for text in cleaned]
+    chunked = [chunks for chunks, _ in split]
+    chunk_stats = bvs.TextChunker.stats([chunk for chunks in chunked for chunk in chunks],
+                                        sum((Counter(stats["boundaries"]) for _, stats in split), Counter()))
+    stage.add(chars=sum(len(text) for text in cleaned), chunks=chunk_stats["chunks"],
+              mean_chunk_chars=chunk_stats["mean_chars"], max_chunk_chars=chunk_stats["max_chars"],
+              boundaries=chunk_stats["boundaries"])
+
+    chunk_dir = os.path.join(workdir, "chunks")
+    os.makedirs(chunk_dir)
+    chunk_paths = [[os.path.join(chunk_dir, f"{ci:04d}_{ki:04d}.mp3") for ki in range(len(chunks))]
+                   for ci, chunks in enumerate(chunked)]
+    flat_chunks = [chunk for chunks in chunked for chunk in chunks]
+    flat_paths = [path for paths in chunk_paths for path in paths]
+    with Stage("synthesize", results) as stage:
+        with bvs.ChunkSynthesizer(converter, "Stub") as synthesizer:
+            ok = synthesizer.synthesize_all(flat_chunks, flat_paths)
+    stage.add(chars=sum(len(chunk) for chunk in flat_chunks), chunks=len(flat_chunks), failed=ok.count(False))
+    if synthesizer.scheduler is not None:
+        stage.add(requests=synthesizer.scheduler.stats["requests"], retries=synthesizer.scheduler.stats["retries"],
+                  throttled=synthesizer.scheduler.stats["throttled"], errors=synthesizer.scheduler.stats["error"],
+                  final_concurrency=int(synthesizer.scheduler.limit),
+                  server_responses={str(status): count for status, count in sorted(server.counts.items())})
+
+    chapter_paths = []
+    with Stage("chunk_merge", results) as stage:
+        for ci, paths in enumerate(chunk_paths):
+            chapter_path = os.path.join(workdir, f"chapter_{ci:04d}.mp3")
+            if converter.audio_merger.merge(paths, chapter_path):
+                chapter_paths.append(chapter_path)
+    stage.add(chunks=len(flat_paths), audio_minutes=round(sum(map(mp3_seconds, chapter_paths)) / 60, 2))
+
+    audio_files = [{'title': f"Chapter {ci + 1}", 'path': path} for ci, path in enumerate(chapter_paths)]
+    merged_path = os.path.join(workdir, "complete.mp3")
+    with Stage("merge_audio_files", results) as stage:
+        converter.merge_audio_files_fast(audio_files, merged_path, "bench")
+    merge_stats = converter.last_merge_stats or {}
+    stage.add(chapters=len(audio_files), audio_minutes=round(mp3_seconds(merged_path) / 60, 2),
+              method=merge_stats.get("method"), within_budget=merge_stats.get("within_budget"))
+
+    with Stage("end_to_end", results) as stage:
+        produced = converter.process_chapters_fast(pdf_path, None, tts_method="Stub", pdf_filename="bench")
+    stage.add(pages=args.pages, chars=text_chars, chapters=len(produced),
+              audio_minutes=round(sum(mp3_seconds(f['path']) for f in produced) / 60, 2),
+              pipeline=converter.last_pipeline.stage_stats())
+
+    return {
+        "config": {
+            "pages": args.pages,
+            "pages_per_chapter": args.pages_per_chapter,
+            "scanned_ratio": args.scanned,
+            "stub_latency_s": args.latency,
+            "http": args.http,
+            "tts_concurrency": args.tts_concurrency,
+            "memory_budget_mb": args.memory_budget_mb,
+            "extract_workers": converter.extract_workers,
+            "ocr": bool(args.ocr and bvs.ocr_available()),
+            "backend": "pymupdf" if bvs.FITZ_AVAILABLE else "pypdf2",
+        },
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             * (1 if sys.platform == "darwin" else 1024) / 2 ** 20, 1),
+        "stages": results,
+        "metrics": converter.metrics.snapshot(),
+    }
+
+
+def print_table(report, baseline=None):
+    print(f"{'stage':<18}{'seconds':>10}{'pages/s':>10}{'chars/s':>12}{'audio-min/s':>13}{'peak MB':>9}"
+          + ("   vs baseline" if baseline else ""))
+    for name, stage in report["stages"].items():
+        line = (f"{name:<18}{stage['seconds']:>10.3f}{stage.get('pages_per_s', ''):>10}"
+                f"{stage.get('chars_per_s', ''):>12}{stage.get('audio_minutes_per_s', ''):>13}"
+                f"{stage['peak_rss_mb']:>9}")
+        old = (baseline or {}).get("stages", {}).get(name)
+        if old and old["seconds"]:
+            change = (stage["seconds"] - old["seconds"]) / old["seconds"] * 100
+            line += f"   {change:+.1f}% time"
+        print(line)
+    print(f"process peak RSS: {report['peak_rss_mb']} MB")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark PDF -> audiobook hot paths offline.")
+    parser.add_argument("--pages", type=int, default=100, help="pages in the synthetic PDF")
+    parser.add_argument("--pages-per-chapter", type=int, default=10)
+    parser.add_argument("--scanned", type=float, default=0.0, help="share of image-only pages (0-1)")
+    parser.add_argument("--ocr", action="store_true", help="OCR scanned pages (needs Tesseract)")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub engine delay per chunk (s)")
+    parser.add_argument("--tts-concurrency", type=int, default=4)
+    parser.add_argument("--extract-workers", type=int, default=None)
+    parser.add_argument("--memory-budget-mb", type=float, help="assembly memory budget (MB)")
+    parser.add_argument("--chunk-profile", choices=sorted(bvs.CHUNK_PROFILES), default="Edge",
+                        help="size chunks like this engine")
+    parser.add_argument("--http", action="store_true",
+                        help="serve the stub engine from a local stand-in TTS server")
+    parser.add_argument("--server-rate", type=float, help="stand-in server: requests/s before it answers 429")
+    parser.add_argument("--server-throttle", type=float, default=0.0, help="stand-in server: random 429 share")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="stand-in server: random 500 share")
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="client token-bucket rate (requests/s)")
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="earlier --json report to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bench_audiobook_")
+    try:
+        if args.http:
+            with StandInTTSServer(latency=args.latency, rate=args.server_rate, throttle_share=args.server_throttle,
+                                  error_share=args.server_errors, seed=args.seed) as server:
+                report = run_benchmarks(args, workdir, server)
+        else:
+            report = run_benchmarks(args, workdir)
+    finally:
+        if args.keep:
+            print(f"work directory kept: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(report, baseline)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,147 +1,3559 @@
-import streamlit as st
-import PyPDF2
-import pyttsx3
-from gtts import gTTS
 import os
+import sys
+import array
 import tempfile
-from PIL import Image
-import pytesseract
-import fitz  # PyMuPDF
-from pydub import AudioSegment
-from pydub.effects import normalize
-import base64
 import json
 import re
-from pathlib import Path
 import io
 import warnings
 import subprocess
-import requests
-import numpy as np
 import datetime
 import asyncio
+import threading
+import hashlib
+import math
+import multiprocessing
+import random
+import zlib
+import importlib.util
+import logging
+import shutil
+import time
+import queue
+from collections import Counter, OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 warnings.filterwarnings('ignore')
 
-# Try to import edge-tts for better quality free TTS
-try:
-    import edge_tts
-    EDGE_TTS_AVAILABLE = True
-except ImportError:
-    EDGE_TTS_AVAILABLE = False
-
-# Initialize session state
-if 'chapters' not in st.session_state:
-    st.session_state.chapters = []
-if 'audio_files' not in st.session_state:
-    st.session_state.audio_files = []
-if 'voice_sample' not in st.session_state:
-    st.session_state.voice_sample = None
-if 'selected_chapters' not in st.session_state:
-    st.session_state.selected_chapters = []
+# Heavy engine dependencies (Streamlit, PyPDF2, pyttsx3, gTTS, pydub, PIL,
+# pytesseract, PyMuPDF, edge-tts) are imported where they are used, so the
+# converter can be imported headless and batch workers start quickly.
+logger = logging.getLogger("book_voice_studio")
+
+# edge-tts gives better quality free TTS
+EDGE_TTS_AVAILABLE = importlib.util.find_spec("edge_tts") is not None
+
+# PyMuPDF is much faster than PyPDF2 and can be sharded across processes
+FITZ_AVAILABLE = importlib.util.find_spec("fitz") is not None
+
+# NumPy vectorizes loudness measurement for voice matching (pure Python otherwise)
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# Simple chapter detection
+CHAPTER_HEADING_RE = re.compile(r'Chapter\s+\d+|CHAPTER\s+\d+', re.IGNORECASE)
+
+# A page-edge line that is only a page number ("12", "- 12 -", "Page 3 of 40", "xiv").
+# Roman numerals must be well formed and below cd, so words like "did",
+# "mild." or "civil." are not taken for front-matter page numbers.
+PAGE_NUMBER_RE = re.compile(
+    r'^\W*(?:[Pp]age\s+)?(?:\d+|(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3}))'
+    r'(?:\s*(?:of|/)\s*\d+)?\W*$'
+)
+
+# How many chunks each engine synthesizes at once
+DEFAULT_TTS_CONCURRENCY = {
+    "Edge": 8,      # network-bound, async
+    "gTTS": 4,      # network-bound, blocking
+    "pyttsx3": min(8, os.cpu_count() or 1),  # worker processes, one engine each (1 = in-process)
+}
+
+# Chunk sizes (characters) per engine. gTTS re-splits every request into
+# ~100-char calls made one after another, so short chunks let the pool run
+# them side by side; Edge streams long payloads over one connection.
+CHUNK_PROFILES = {
+    "Edge": {"min_chars": 800, "target_chars": 2000, "max_chars": 4000},
+    "gTTS": {"min_chars": 200, "target_chars": 400, "max_chars": 800},
+    "pyttsx3": {"min_chars": 500, "target_chars": 1500, "max_chars": 3000},
+}
+DEFAULT_CHUNK_PROFILE = {"min_chars": 500, "target_chars": 1500, "max_chars": 3000}
+
+# A blank line between paragraphs (kept by text cleaning for the chunker)
+PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+
+# A paragraph break, or sentence-final punctuation (plus closing quotes/brackets)
+SENTENCE_END_RE = re.compile(r'(?P<paragraph>\n[ \t]*\n\s*)|(?P<sentence>[.!?]+[\'")\]]*)(?=\s|$)')
+
+# Abbreviations and initials whose period does not end a sentence
+ABBREVIATION_RE = re.compile(
+    r'(?:^|[^\w.])(?:[A-Z]|[Mm]rs?|[Mm]s|[Dd]r|[Pp]rof|[Ss]t|[Jj]r|[Ss]r|vs|etc|e\.g|i\.e|[Nn]o|[Ff]ig|[Vv]ol|[Cc]h|pp?)$'
+)
+
+# Request rate limits of the online engines (requests/s and burst size)
+ONLINE_RATE_LIMITS = {
+    "Edge": {"rate": 10.0, "burst": 20},
+    "gTTS": {"rate": 4.0, "burst": 8},
+}
+
+# Settings that change the audio an engine produces (with their defaults)
+ENGINE_SETTING_DEFAULTS = {
+    "Edge": {"edge_voice": "en-US-AriaNeural"},
+    "gTTS": {"language": "en"},
+    "pyttsx3": {"rate": 180},
+}
+
+# Single-file audiobook formats: codec settings at speech bitrates, plus muxer
+BOOK_FORMATS = {
+    "m4b": {
+        "extension": ".m4b",
+        "mime": "audio/mp4",
+        "codec": ["-c:a", "aac", "-b:a", "64k"],
+        "muxer": ["-f", "mp4", "-movflags", "+faststart"],
+    },
+    "opus": {
+        "extension": ".opus",
+        "mime": "audio/ogg",
+        "codec": ["-c:a", "libopus", "-b:a", "32k", "-ar", "48000"],
+        "muxer": ["-f", "ogg"],
+    },
+}
+
+# Root for persistent caches (TTS chunks, ...)
+DEFAULT_CACHE_DIR = os.environ.get(
+    "BOOK_VOICE_STUDIO_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "book_voice_studio")
+)
+
+
+def normalize_engine_name(tts_method):
+    """Map a UI label ("Edge TTS (Microsoft...)", "Edge", "gTTS"...) to an engine key"""
+    name = tts_method.split()[0] if tts_method else ""
+    if name == "Edge" and EDGE_TTS_AVAILABLE:
+        return "Edge"
+    if name == "gTTS":
+        return "gTTS"
+    return "pyttsx3"
+
+def engine_settings(engine, voice_settings=None):
+    """The subset of voice_settings that affects the given engine's output"""
+    settings = dict(ENGINE_SETTING_DEFAULTS.get(engine, {}))
+    for key in settings:
+        if voice_settings and voice_settings.get(key) is not None:
+            settings[key] = voice_settings[key]
+    return settings
+
+
+def _worker_context():
+    """Start method for worker processes.
+
+    Pools are started from pipeline and TTS threads while the event loop
+    and thread pools run, so this process is never forked: forkserver
+    where available, spawn elsewhere.
+    """
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(start_method)
+
+
+def _link_or_copy(src, dst):
+    """Hard-link src to dst, falling back to a copy (e.g. across filesystems).
+
+    The file appears at dst atomically, so readers never see a partial output.
+    """
+    tmp_path = f"{dst}.{os.getpid()}.part"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def _copy_file(src, dst):
+    """Copy src to dst atomically; unlike _link_or_copy, dst never shares src's inode"""
+    tmp_path = f"{dst}.{os.getpid()}.part"
+    try:
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _move_or_copy(src, dst):
+    """Rename src to dst (atomic on one filesystem), copying across filesystems"""
+    try:
+        os.replace(src, dst)
+    except OSError:
+        _link_or_copy(src, dst)
+        os.remove(src)
+
+def _pdf_source(pdf_file):
+    """A path or the raw bytes of pdf_file (path, file object or Streamlit upload)"""
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return os.fspath(pdf_file)
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if hasattr(pdf_file, 'getvalue'):
+        return pdf_file.getvalue()
+    if hasattr(pdf_file, 'seek'):
+        pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def _open_pdf(source):
+    import fitz  # PyMuPDF
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _pdf_digest(source):
+    """SHA-256 of a PDF given as a path or bytes"""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        digest.update(source)
+    return digest.hexdigest()
+
+
+def _read_outline(source):
+    """(page_count, [(level, title, first_page)]) from the PDF's outline/bookmarks"""
+    if FITZ_AVAILABLE:
+        doc = _open_pdf(source)
+        try:
+            # get_toc pages are 1-based; <= 0 means the entry has no destination
+            return doc.page_count, [(level, title, page - 1) for level, title, page in doc.get_toc(simple=True)]
+        finally:
+            doc.close()
+    import PyPDF2
+    reader = PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+    entries = []
+
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                entries.append((level, item.title, reader.get_destination_page_number(item)))
+            except Exception:
+                continue
+
+    walk(reader.outline, 1)
+    return len(reader.pages), entries
+
+
+def _outline_chapters(entries, page_count):
+    """Page ranges from the shallowest outline level with at least two chapters.
+
+    Returns [{"title", "start", "stop"}] (0-based, stop exclusive), or None
+    when the outline is too thin to be useful. Pages before the first entry
+    become "Front Matter".
+    """
+    for level in sorted({level for level, _, _ in entries}):
+        starts = {}
+        for entry_level, title, page in entries:
+            if entry_level == level and 0 <= page < page_count and page not in starts:
+                starts[page] = " ".join(title.split()) or f"Chapter {len(starts) + 1}"
+        if len(starts) < 2:
+            continue
+        pages = sorted(starts)
+        chapters = []
+        if pages[0] > 0:
+            chapters.append({"title": "Front Matter", "start": 0, "stop": pages[0]})
+        for start, stop in zip(pages, pages[1:] + [page_count]):
+            chapters.append({"title": starts[start], "start": start, "stop": stop})
+        return chapters
+    return None
+
+
+def _spread_pages(page_count, count):
+    """Up to count page numbers spread evenly over [0, page_count)"""
+    if page_count <= count:
+        return list(range(page_count))
+    return sorted({round(idx * (page_count - 1) / (count - 1)) for idx in range(count)})
+
+
+def _heading_title(text, match):
+    """The line holding a chapter heading match, tidied up as a title"""
+    line_start = text.rfind("\n", 0, match.start()) + 1
+    line_end = text.find("\n", match.end())
+    line = " ".join(text[line_start:line_end if line_end >= 0 else len(text)].split())
+    return line[:80] or match.group(0)
+
+
+def _extract_page_range(source, start, stop, ocr_min_chars=0):
+    """Text of pages [start, stop) via PyMuPDF (runs in worker processes).
+
+    Returns (page_num, text, needs_ocr) tuples. A page needs OCR when it
+    carries images but fewer than ocr_min_chars characters of text layer.
+    """
+    doc = _open_pdf(source)
+    try:
+        records = []
+        for page_num in range(start, stop):
+            page = doc[page_num]
+            text = page.get_text("text")
+            needs_ocr = (bool(ocr_min_chars) and len(text.strip()) < ocr_min_chars
+                         and bool(page.get_images(full=False)))
+            records.append((page_num, text, needs_ocr))
+        return records
+    finally:
+        doc.close()
+
+
+def _ocr_page(source, page_num, dpi, lang):
+    """Rasterize one page and OCR it with Tesseract (runs in worker processes)"""
+    import fitz  # PyMuPDF
+    import pytesseract
+    from PIL import Image
+    doc = _open_pdf(source)
+    try:
+        pix = doc[page_num].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        return pytesseract.image_to_string(image, lang=lang)
+    finally:
+        doc.close()
+
+
+def ocr_available():
+    """True when PyMuPDF, pytesseract and the Tesseract binary are all present"""
+    if not FITZ_AVAILABLE:
+        return False
+    try:
+        import pytesseract
+    except ImportError:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+_LOG_LEVELS = {"success": logging.INFO, "info": logging.INFO,
+               "warning": logging.WARNING, "error": logging.ERROR}
+
+
+def _log_message(level, message):
+    logger.log(_LOG_LEVELS.get(level, logging.INFO), message)
 
 class FastVoiceCloner:
-    """Simplified, faster voice cloning"""
+    """Simplified, faster voice cloning.
+
+    The voice sample's loudness becomes the target; a chapter's loudness is
+    measured block by block from its chunk files and the difference is
+    handed to the merger as gain_db, so matching happens inside the single
+    write that produces the chapter (no extra decode/encode generation).
+    ``target`` picks the measure: "loudness" (gated, see LoudnessMeter) or
+    "dBFS" (plain RMS, the original behaviour).
+    """
     
-    def __init__(self):
+    def __init__(self, notify=None, target="loudness"):
         self.sample_rate = 16000  # Lower sample rate for faster processing
         self.voice_characteristics = None
+        self.notify = notify or _log_message
+        self.target = target
+        
+    def measure(self, audio_paths, sample_rate=None):
+        """LoudnessMeter fed with audio_paths in order, one block at a time"""
+        native_rate, channels = _probe_audio_format(audio_paths[0])
+        sample_rate = sample_rate or native_rate
+        meter = LoudnessMeter(sample_rate, channels)
+        for path in audio_paths:
+            for block in iter_pcm_blocks(path, sample_rate, channels):
+                meter.feed(block)
+        return meter
         
     def analyze_voice_sample(self, audio_path):
         """Quick voice analysis - minimal processing"""
         try:
-            audio = AudioSegment.from_file(audio_path)
-            audio = audio.set_channels(1)
-            audio = audio.set_frame_rate(self.sample_rate)
-            
-            # Store basic characteristics only
-            self.voice_characteristics = {
-                'rate': audio.frame_rate,
-                'dBFS': audio.dBFS,
-            }
+            meter = self.measure([audio_path], sample_rate=self.sample_rate)
+            if not meter.samples:
+                raise ValueError("voice sample contains no audio")
+            
+            # Store basic characteristics only
+            self.voice_characteristics = {
+                'rate': self.sample_rate,
+                'dBFS': meter.dbfs(),
+                'loudness': meter.loudness(),
+            }
+            return True
+        except Exception as e:
+            self.notify("error", f"Error analyzing voice: {str(e)}")
+            return False
+    
+    def gain_db(self, audio_paths):
+        """Gain that brings audio_paths to the voice sample's level (0.0 if unknown).
+
+        Positive gain is capped so the loudest sample doesn't clip.
+        """
+        if not self.voice_characteristics:
+            return 0.0
+        try:
+            meter = self.measure(audio_paths)
+        except Exception as e:
+            self.notify("warning", f"Voice matching skipped: {str(e)}")
+            return 0.0
+        target = self.voice_characteristics.get(self.target)
+        current = meter.loudness() if self.target == "loudness" else meter.dbfs()
+        if target is None or current is None:
+            target, current = self.voice_characteristics['dBFS'], meter.dbfs()
+        if target is None or current is None:
+            return 0.0  # silent sample or chapter
+        return min(target - current, -meter.peak_db())
+    
+    def apply_basic_voice_transfer(self, source_audio_path, output_path):
+        """Fast, basic voice matching"""
+        try:
+            # Only apply volume matching for speed, in one pass over the file
+            gain = self.gain_db([source_audio_path])
+            return bool(StreamingAudioMerger().merge([source_audio_path], output_path, gain_db=gain))
+        except Exception as e:
+            self.notify("error", f"Error matching voice: {str(e)}")
+            return False
+
+# Upper bounds (seconds) of the TTS request latency histogram
+TTS_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _label_suffix(labels):
+    return "".join(f"[{value}]" for _, value in labels)
+
+
+class ConversionMetrics:
+    """Thread-safe instrumentation for a converter.
+
+    Collects per-stage timers (extract, clean, split, synthesize per engine,
+    merge, voice_match, export), TTS latency histograms, synthesized
+    characters, chunk failure counts, cache hits and peak memory. ``snapshot()`` /
+    ``to_json()`` give a run report and ``to_prometheus()`` renders the same
+    numbers in the Prometheus text exposition format.
+    """
+
+    def __init__(self, chunk_cache=None):
+        self.chunk_cache = chunk_cache
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._timers = {}      # (stage, labels) -> [count, seconds, max]
+            self._counters = {}    # (name, labels) -> value
+            self._gauges = {}      # (name, labels) -> highest value seen
+            self._tts = {}         # engine -> histogram and throughput window
+
+    @contextmanager
+    def stage(self, name, **labels):
+        """Time a block as one run of the given stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - started, **labels)
+
+    def observe_stage(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_max(self, name, value, **labels):
+        """Keep the highest value seen for a gauge (e.g. peak memory)"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def observe_tts(self, engine, started, finished, chars, ok):
+        """Record one engine request (perf_counter timestamps)"""
+        latency = finished - started
+        with self._lock:
+            tts = self._tts.setdefault(engine, {
+                "buckets": [0] * len(TTS_LATENCY_BUCKETS), "count": 0, "sum": 0.0,
+                "chars": 0, "first": started, "last": finished,
+            })
+            for idx, bound in enumerate(TTS_LATENCY_BUCKETS):
+                if latency <= bound:
+                    tts["buckets"][idx] += 1
+            tts["count"] += 1
+            tts["sum"] += latency
+            tts["first"] = min(tts["first"], started)
+            tts["last"] = max(tts["last"], finished)
+            if ok:
+                tts["chars"] += chars
+        self.observe_stage("synthesize", latency, engine=engine)
+        self.inc("tts_chunks", engine=engine, result="ok" if ok else "failed")
+        if not ok:
+            self.inc("chunk_failures", engine=engine)
+
+    def snapshot(self):
+        """JSON-serializable run report"""
+        with self._lock:
+            stages = {}
+            for (name, labels), (count, seconds, longest) in sorted(self._timers.items()):
+                stages[name + _label_suffix(labels)] = {"count": count, "seconds": round(seconds, 4), "max_seconds": round(longest, 4)}
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters[name + _label_suffix(labels)] = value
+            gauges = {}
+            for (name, labels), value in sorted(self._gauges.items()):
+                gauges[name + _label_suffix(labels)] = value
+            engines = {}
+            for engine, tts in self._tts.items():
+                window = tts["last"] - tts["first"]
+                engines[engine] = {
+                    "requests": tts["count"],
+                    "latency_seconds_sum": round(tts["sum"], 4),
+                    "latency_seconds_avg": round(tts["sum"] / tts["count"], 4) if tts["count"] else 0.0,
+                    "latency_buckets": {str(bound): count for bound, count in zip(TTS_LATENCY_BUCKETS, tts["buckets"])},
+                    "chars": tts["chars"],
+                    "chars_per_second": round(tts["chars"] / window, 1) if window > 0 else 0.0,
+                }
+        report = {
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "stages": stages,
+            "counters": counters,
+            "gauges": gauges,
+            "tts": engines,
+        }
+        if self.chunk_cache is not None:
+            report["chunk_cache"] = self.chunk_cache.stats()
+        return report
+
+    def to_json(self, path=None):
+        """Run report as a JSON string, also written to path if given"""
+        text = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, prefix="audiobook"):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            tts_items = sorted((engine, dict(tts, buckets=list(tts["buckets"]))) for engine, tts in self._tts.items())
+
+        family("stage_seconds_total", "counter", "Time spent per pipeline stage.")
+        for (name, labels), (_, seconds, _) in timers:
+            lines.append(f"{prefix}_stage_seconds_total{_prometheus_labels((('stage', name),) + labels)} {seconds:.6f}")
+        family("stage_runs_total", "counter", "Runs per pipeline stage.")
+        for (name, labels), (count, _, _) in timers:
+            lines.append(f"{prefix}_stage_runs_total{_prometheus_labels((('stage', name),) + labels)} {count}")
+
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            family(f"{name}_total", "counter", f"Count of {name.replace('_', ' ')}.")
+            for (counter, labels), value in counters:
+                if counter == name:
+                    lines.append(f"{prefix}_{name}_total{_prometheus_labels(labels)} {value}")
+
+        for name in sorted({name for (name, _), _ in gauges}):
+            family(name, "gauge", f"Highest {name.replace('_', ' ')} observed.")
+            for (gauge, labels), value in gauges:
+                if gauge == name:
+                    lines.append(f"{prefix}_{name}{_prometheus_labels(labels)} {value}")
+
+        family("tts_request_seconds", "histogram", "TTS request latency.")
+        for engine, tts in tts_items:
+            for bound, count in zip(TTS_LATENCY_BUCKETS, tts["buckets"]):
+                lines.append(f"{prefix}_tts_request_seconds_bucket"
+                             f"{_prometheus_labels((('engine', engine), ('le', bound)))} {count}")
+            lines.append(f"{prefix}_tts_request_seconds_bucket"
+                         f"{_prometheus_labels((('engine', engine), ('le', '+Inf')))} {tts['count']}")
+            lines.append(f"{prefix}_tts_request_seconds_sum{_prometheus_labels((('engine', engine),))} {tts['sum']:.6f}")
+            lines.append(f"{prefix}_tts_request_seconds_count{_prometheus_labels((('engine', engine),))} {tts['count']}")
+        family("tts_chars_total", "counter", "Characters synthesized.")
+        for engine, tts in tts_items:
+            lines.append(f"{prefix}_tts_chars_total{_prometheus_labels((('engine', engine),))} {tts['chars']}")
+
+        if self.chunk_cache is not None:
+            stats = self.chunk_cache.stats()
+            for key in ("hits", "misses", "stores", "evictions"):
+                family(f"chunk_cache_{key}_total", "counter", f"TTS chunk cache {key}.")
+                lines.append(f"{prefix}_chunk_cache_{key}_total {stats[key]}")
+            family("chunk_cache_bytes", "gauge", "Size of the TTS chunk cache.")
+            lines.append(f"{prefix}_chunk_cache_bytes {stats['bytes']}")
+        return "\n".join(lines) + "\n"
+
+class TTSChunkCache:
+    """Content-addressed on-disk cache of synthesized chunks.
+
+    Entries are keyed by a hash of (cleaned chunk text, engine, engine
+    settings). Writes go to a temp file in the cache directory and are
+    published with ``os.replace``, so several workers (threads or processes)
+    can share one cache directory. The directory is scanned once, on the
+    first store, into an in-memory LRU index (by mtime, refreshed on every
+    hit); when the total size exceeds ``max_bytes`` the least recently used
+    entries are evicted down to ``LOW_WATER`` of it, so a full cache is not
+    trimmed again on every store.
+    """
+
+    # Eviction frees space down to this share of max_bytes
+    LOW_WATER = 0.9
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, "tts")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._index = None  # path -> size, least recently used first (see _load_index)
+        self._size = 0
+
+    @staticmethod
+    def make_key(text, engine, settings=None):
+        """Stable hash of everything that determines a chunk's audio"""
+        payload = json.dumps(
+            {"text": text, "engine": engine, "settings": settings or {}},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.audio")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".audio"):
+                    yield os.path.join(root, name)
+
+    def _load_index(self):
+        """Scan the directory once into the LRU index; call with _lock held"""
+        if self._index is not None:
+            return
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        self._index = OrderedDict((path, size) for _, path, size in sorted(entries))
+        self._size = sum(self._index.values())
+
+    def fetch(self, key, output_path):
+        """Place a copy of a cached chunk at output_path; returns False on a miss.
+
+        Copied rather than hard-linked: outputs published from the chunk must
+        not share an inode with the entry (edits, mtimes, eviction).
+        """
+        path = self._entry_path(key)
+        try:
+            os.utime(path)  # mark as recently used
+            _copy_file(path, output_path)
+        except OSError:
+            # Missing, or evicted by another worker in the meantime
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+            if self._index is not None and path in self._index:
+                self._index.move_to_end(path)
+        return True
+
+    def store(self, key, source_path):
+        """Atomically add a synthesized chunk to the cache"""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        with self._lock:
+            self.stores += 1
+            self._load_index()
+            self._size += size - self._index.pop(path, 0)
+            self._index[path] = size
+            over_budget = self.max_bytes and self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+        return True
+
+    def evict(self):
+        """Drop least recently used entries until the cache is down to LOW_WATER of max_bytes"""
+        with self._lock:
+            self._load_index()
+            target = self.max_bytes * self.LOW_WATER
+            while self._index and self._size > target:
+                path, size = self._index.popitem(last=False)
+                self._size -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue  # already evicted by another worker
+                self.evictions += 1
+
+    def stats(self):
+        """Hit/miss counters for reporting"""
+        with self._lock:
+            self._load_index()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes": self._size,
+            }
+
+# MPEG audio Layer III header tables (index 0 = free format, 15 = invalid)
+_MP3_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_MP3_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+_MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+Mp3FrameInfo = namedtuple(
+    "Mp3FrameInfo",
+    "version sample_rate_index sample_rate mode channels bitrate_index bitrate size samples protected"
+)
+
+
+def parse_mp3_header(header):
+    """Parse a 4-byte MPEG Layer III frame header; None if it isn't one"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = (_MP3_BITRATES_V1 if mpeg1 else _MP3_BITRATES_V2)[bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    mode = header[3] >> 6
+    protected = not header[1] & 0x01  # a CRC-16 follows the header
+    return Mp3FrameInfo(
+        version=version,
+        sample_rate_index=sample_rate_index,
+        sample_rate=sample_rate,
+        mode=mode,
+        channels=1 if mode == 3 else 2,
+        bitrate_index=bitrate_index,
+        bitrate=bitrate,
+        size=(144 if mpeg1 else 72) * bitrate // sample_rate + padding,
+        samples=1152 if mpeg1 else 576,
+        protected=protected,
+    )
+
+
+def _mp3_side_info_size(info):
+    if info.version == 3:
+        return 17 if info.channels == 1 else 32
+    return 9 if info.channels == 1 else 17
+
+
+def _is_vbr_info_frame(frame, info):
+    """Xing/Info/VBRI frames carry no audio, only whole-file metadata"""
+    offset = (6 if info.protected else 4) + _mp3_side_info_size(info)
+    return frame[offset:offset + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+# Magics of containers that are not raw MP3 even when the file is named .mp3
+# (pyttsx3's eSpeak driver writes WAV whatever the extension)
+_NON_MP3_MAGICS = (b"RIFF", b"RIFX", b"RF64", b"FORM", b"OggS", b"fLaC", b"caff", b".snd")
+
+# Headers that must chain by frame size before a sync is trusted
+MP3_SYNC_FRAMES = 3
+_MP3_MAX_FRAME = 2881
+
+
+def _mp3_chain(buf, pos, info, eof):
+    """True when MP3_SYNC_FRAMES headers of one stream follow each other from pos"""
+    for _ in range(MP3_SYNC_FRAMES - 1):
+        pos += info.size
+        if eof and pos == len(buf):
+            return True  # a stream shorter than MP3_SYNC_FRAMES ending cleanly
+        following = parse_mp3_header(buf[pos:pos + 4])
+        if following is None or _stream_signature(following) != _stream_signature(info):
+            return False
+        info = following
+    return True
+
+
+def iter_mp3_frames(path, block_size=1 << 16):
+    """Yield (Mp3FrameInfo, frame_bytes) for every audio frame in an MP3 file.
+
+    Reads in fixed-size blocks, so memory stays constant regardless of file
+    length. ID3 tags, junk between frames and the leading Xing/Info frame
+    are skipped. A header is only trusted once MP3_SYNC_FRAMES of them chain
+    by their frame sizes, so sample data of WAV/PCM files that happens to
+    look like a header is not taken for audio.
+    """
+    with open(path, "rb") as f:
+        buf = f.read(block_size)
+        eof = len(buf) < block_size
+        pos = 0
+        if buf[:4] in _NON_MP3_MAGICS or buf[4:8] == b"ftyp":
+            return
+        if buf[:3] == b"ID3" and len(buf) >= 10:
+            tag_size = ((buf[6] & 0x7F) << 21 | (buf[7] & 0x7F) << 14
+                        | (buf[8] & 0x7F) << 7 | (buf[9] & 0x7F)) + 10
+            if buf[5] & 0x10:
+                tag_size += 10  # footer present
+            if tag_size > len(buf):
+                f.seek(tag_size)
+                buf = f.read(block_size)
+                eof = len(buf) < block_size
+            else:
+                pos = tag_size
+        first = True
+        synced = False
+        lookahead = MP3_SYNC_FRAMES * _MP3_MAX_FRAME + 4
+        while True:
+            # Keep enough maximum-size frames buffered to check a sync
+            if len(buf) - pos < lookahead and not eof:
+                more = f.read(max(block_size, lookahead))
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            if len(buf) - pos < 4:
+                return
+            info = parse_mp3_header(buf[pos:pos + 4])
+            if info is not None and not synced:
+                synced = _mp3_chain(buf, pos, info, eof)
+            if not synced:
+                pos += 1
+                continue
+            if info is None:
+                synced = False  # lost sync (junk or a damaged frame)
+                continue
+            if pos + info.size > len(buf):
+                return  # truncated trailing frame
+            frame = buf[pos:pos + info.size]
+            pos += info.size
+            if first:
+                first = False
+                if _is_vbr_info_frame(frame, info):
+                    continue
+            yield info, frame
+
+
+def probe_mp3(path):
+    """Header info of the first audio frame, or None for non-MP3 files"""
+    try:
+        for info, _ in iter_mp3_frames(path, block_size=1 << 14):
+            return info
+    except OSError:
+        pass
+    return None
+
+
+def make_silent_mp3_frame(info):
+    """A frame matching info's stream that decodes to digital silence.
+
+    All-zero side information means no Huffman data (part2_3_length = 0) and
+    main_data_begin = 0, so the frame does not borrow from the bit reservoir.
+    """
+    header = bytes((
+        0xFF,
+        0xE0 | (info.version << 3) | (1 << 1) | 0x01,  # Layer III, no CRC
+        (info.bitrate_index << 4) | (info.sample_rate_index << 2),
+        info.mode << 6,
+    ))
+    return header + bytes(parse_mp3_header(header).size - 4)
+
+
+# One global_gain step scales samples by 2 ** (1/4), i.e. about 1.5 dB
+MP3_GAIN_STEP_DB = 20 * math.log10(2 ** 0.25)
+
+
+def _mp3_crc16(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005 if crc & 0x8000 else crc << 1) & 0xFFFF
+    return crc
+
+
+def adjust_mp3_frame_gain(frame, info, steps):
+    """Return frame with every granule's global_gain moved by steps.
+
+    global_gain is the scale the decoder applies to a granule's Huffman
+    coded samples, so changing it adjusts loudness in MP3_GAIN_STEP_DB
+    steps without decoding or re-encoding anything (the mp3gain trick).
+    """
+    if not steps:
+        return frame
+    start = 6 if info.protected else 4
+    size = _mp3_side_info_size(info)
+    side = int.from_bytes(frame[start:start + size], "big")
+    bits = size * 8
+    if info.version == 3:
+        # main_data_begin(9) private_bits(5|3) scfsi(4 per channel); 59 bits per granule/channel
+        first, stride, granules = (18 if info.channels == 1 else 20), 59, 2
+    else:
+        # main_data_begin(8) private_bits(1|2); 63 bits per granule/channel
+        first, stride, granules = (9 if info.channels == 1 else 10), 63, 1
+    for idx in range(granules * info.channels):
+        # global_gain follows part2_3_length(12) and big_values(9)
+        shift = bits - (first + idx * stride + 21) - 8
+        gain = min(255, max(0, ((side >> shift) & 0xFF) + steps))
+        side = side & ~(0xFF << shift) | (gain << shift)
+    side_info = side.to_bytes(size, "big")
+    if info.protected:
+        crc = _mp3_crc16(frame[2:4] + side_info).to_bytes(2, "big")
+        return frame[:4] + crc + side_info + frame[start + size:]
+    return frame[:4] + side_info + frame[start + size:]
+
+
+def _stream_signature(info):
+    return (info.version, info.sample_rate, info.mode == 3)
+
+
+def _probe_audio_format(path):
+    """(sample_rate, channels) of an MP3 or WAV file, with a speech default"""
+    info = probe_mp3(path)
+    if info is not None:
+        return info.sample_rate, info.channels
+    try:
+        import wave
+        with wave.open(path, "rb") as wav:
+            return wav.getframerate(), wav.getnchannels()
+    except Exception:
+        return 24000, 1
+
+
+def iter_pcm_blocks(path, sample_rate, channels, block_bytes=1 << 20, ffmpeg_path=None):
+    """Yield a file's audio as 16-bit little-endian PCM blocks.
+
+    Decodes through an ffmpeg pipe when available, so only one block is in
+    memory at a time. Without ffmpeg, matching WAVs are read directly and
+    anything else is decoded per file with pydub.
+    """
+    frame_bytes = 2 * channels
+    block_bytes -= block_bytes % frame_bytes
+    ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+    if ffmpeg_path:
+        decoder = subprocess.Popen(
+            [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-i", path,
+             "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        try:
+            yield from iter(lambda: decoder.stdout.read(block_bytes), b"")
+        finally:
+            decoder.stdout.close()
+            if decoder.poll() is None:
+                decoder.kill()
+            decoder.wait()
+        return
+    try:
+        import wave
+        with wave.open(path, "rb") as wav:
+            if (wav.getsampwidth(), wav.getframerate(), wav.getnchannels()) == (2, sample_rate, channels):
+                yield from iter(lambda: wav.readframes(block_bytes // frame_bytes), b"")
+                return
+    except (wave.Error, EOFError):
+        pass
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(path).set_frame_rate(sample_rate).set_channels(channels).set_sample_width(2)
+    data = memoryview(audio.raw_data)
+    for offset in range(0, len(data), block_bytes):
+        yield bytes(data[offset:offset + block_bytes])
+
+
+class LoudnessMeter:
+    """Gated loudness of 16-bit PCM, fed incrementally block by block.
+
+    Follows the BS.1770 gating scheme without the K-weighting filter:
+    mean square over 400 ms windows with 75% overlap, an absolute gate at
+    -70 dB and a relative gate 10 dB below the ungated level, so pauses
+    between sentences don't drag the measurement down. Only one value per
+    100 ms step is kept, never the decoded audio. Uses NumPy when
+    installed.
+    """
+
+    STEP_SECONDS = 0.1
+    WINDOW_STEPS = 4
+    ABSOLUTE_GATE_DB = -70.0
+    RELATIVE_GATE_DB = -10.0
+
+    def __init__(self, sample_rate, channels=1):
+        self.step_samples = max(1, int(sample_rate * self.STEP_SECONDS)) * channels
+        self.samples = 0
+        self.energy = 0.0   # sum of squares (full scale = 1.0)
+        self.peak = 0.0
+        self._pending = b""
+        self._recent = []   # mean squares of the last WINDOW_STEPS - 1 steps
+        self.windows = array.array("d")  # mean square per window
+
+    def feed(self, data):
+        data = self._pending + data
+        usable = len(data) - len(data) % (2 * self.step_samples)
+        self._pending = data[usable:]
+        if usable:
+            if NUMPY_AVAILABLE:
+                step_means = self._step_means_numpy(data[:usable])
+            else:
+                step_means = self._step_means_python(data[:usable])
+            self._add_steps(step_means)
+
+    def _step_means_numpy(self, data):
+        import numpy as np
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float64) / 32768.0
+        squares = samples * samples
+        self.samples += samples.size
+        self.energy += float(squares.sum())
+        self.peak = max(self.peak, float(np.abs(samples).max()))
+        return squares.reshape(-1, self.step_samples).mean(axis=1).tolist()
+
+    def _step_means_python(self, data):
+        samples = array.array("h", data)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        step_means = []
+        for offset in range(0, len(samples), self.step_samples):
+            step = samples[offset:offset + self.step_samples]
+            squares = sum(value * value for value in step) / (32768.0 * 32768.0)
+            self.energy += squares
+            step_means.append(squares / len(step))
+            self.peak = max(self.peak, max(map(abs, step)) / 32768.0)
+        self.samples += len(samples)
+        return step_means
+
+    def _add_steps(self, step_means):
+        recent = self._recent + step_means
+        for idx in range(self.WINDOW_STEPS - 1, len(recent)):
+            self.windows.append(sum(recent[idx - self.WINDOW_STEPS + 1:idx + 1]) / self.WINDOW_STEPS)
+        self._recent = recent[-(self.WINDOW_STEPS - 1):]
+
+    def dbfs(self):
+        """RMS level in dBFS (None for silence)"""
+        if not self.energy:
+            return None
+        return 10 * math.log10(self.energy / self.samples)
+
+    def peak_db(self):
+        """Sample peak in dBFS (None for silence)"""
+        return 20 * math.log10(self.peak) if self.peak else None
+
+    def loudness(self):
+        """Gated level in dB, None when nothing passes the gates"""
+        absolute = 10 ** (self.ABSOLUTE_GATE_DB / 10)
+        if NUMPY_AVAILABLE:
+            import numpy as np
+            windows = np.frombuffer(self.windows, dtype=np.float64)
+            gated = windows[windows > absolute]
+            if not gated.size:
+                return None
+            relative = gated.mean() * 10 ** (self.RELATIVE_GATE_DB / 10)
+            return 10 * math.log10(gated[gated > relative].mean())
+        gated = [value for value in self.windows if value > absolute]
+        if not gated:
+            return None
+        relative = sum(gated) / len(gated) * 10 ** (self.RELATIVE_GATE_DB / 10)
+        gated = [value for value in gated if value > relative]
+        return 10 * math.log10(sum(gated) / len(gated))
+
+
+def audio_duration(path):
+    """Seconds of audio in an MP3 (summed frame headers, no decode) or WAV file"""
+    seconds = 0.0
+    frames = 0
+    try:
+        for info, _ in iter_mp3_frames(path):
+            seconds += info.samples / info.sample_rate
+            frames += 1
+    except OSError:
+        return None
+    if frames:
+        return seconds
+    try:
+        import wave
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except Exception:
+        return None
+
+
+def chapter_markers(audio_files, gap_ms=0):
+    """(start_ms, end_ms, title) per chapter from recorded durations.
+
+    Uses each audio file's 'duration' (recorded at synthesis time) and only
+    reads frame headers for files that lack one; nothing is decoded.
+    """
+    markers = []
+    position = 0.0
+    for idx, audio_file in enumerate(audio_files):
+        if idx and gap_ms > 0:
+            position += gap_ms
+        duration = audio_file.get('duration')
+        if duration is None:
+            duration = audio_duration(audio_file['path']) or 0.0
+        start = position
+        position += duration * 1000
+        markers.append((int(round(start)), int(round(position)), audio_file['title']))
+    return markers
+
+
+def _ffmetadata_escape(value):
+    return re.sub(r'([=;#\\\n])', r'\\\1', str(value))
+
+
+def write_ffmetadata(path, markers, title=None):
+    """Write chapter markers as an ffmpeg metadata file"""
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={_ffmetadata_escape(title)}")
+    for start, end, chapter_title in markers:
+        lines += ["[CHAPTER]", "TIMEBASE=1/1000", f"START={start}", f"END={end}",
+                  f"title={_ffmetadata_escape(chapter_title)}"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+class TextChunker:
+    """Sentence-boundary text chunking with content-defined cut points.
+
+    One linear pass over precompiled patterns splits the text into
+    sentences (skipping abbreviations and initials); sentences are packed
+    into chunks of roughly ``target_chars``. Once a chunk holds
+    ``min_chars`` it may end after a sentence whose CRC-32 picks it as a
+    cut point (longer sentences are likelier picks), and once it is near
+    ``target_chars`` after any paragraph - so boundaries depend on the nearby text
+    rather than on offsets, and an edit only changes the chunks around it
+    (their TTS cache entries stay valid). Chunks never exceed
+    ``max_chars``; an overlong sentence is split at a clause, else a word.
+    """
+
+    # A paragraph break ends a chunk once it holds this share of target_chars
+    PARAGRAPH_SHARE = 0.9
+
+    def __init__(self, min_chars=500, target_chars=1500, max_chars=3000):
+        self.max_chars = max(1, int(max_chars))
+        self.min_chars = min(max(0, int(min_chars)), self.max_chars)
+        self.target_chars = min(max(int(target_chars), self.min_chars), self.max_chars)
+        self.paragraph_chars = max(self.min_chars, int(self.target_chars * self.PARAGRAPH_SHARE))
+        # Past min_chars a sentence is a cut point with probability len / span
+        # (by its hash), so chunks run on average ~span further: ~target_chars
+        self.span = max(1, self.target_chars - self.min_chars)
+
+    @classmethod
+    def for_engine(cls, engine, profiles=None, max_chars=None):
+        profile = dict((profiles or CHUNK_PROFILES).get(engine, DEFAULT_CHUNK_PROFILE))
+        if max_chars:
+            profile = {key: min(value, max_chars) for key, value in profile.items()}
+            profile["max_chars"] = max_chars
+        return cls(**profile)
+
+    @staticmethod
+    def _sentences(text):
+        """Yield (start, end, ending) spans covering the text, ending in sentence/paragraph/end"""
+        start = 0
+        pending = None
+        for match in SENTENCE_END_RE.finditer(text):
+            if match.lastgroup == "sentence" and match.group()[0] == "." \
+                    and ABBREVIATION_RE.search(text[max(0, match.start() - 6):match.start()]):
+                continue
+            end = match.end()
+            if text[start:end].strip():
+                if pending:
+                    yield pending
+                pending = (start, end, match.lastgroup)
+            elif match.lastgroup == "paragraph" and pending:
+                # A paragraph break right after a sentence ends that sentence's paragraph
+                pending = (pending[0], end, "paragraph")
+            start = end
+        if text[start:].strip():
+            if pending:
+                yield pending
+            pending = (start, len(text), "end")
+        if pending:
+            yield pending[0], pending[1], "end"
+
+    def _pieces(self, text, start, end):
+        """Split an overlong sentence at clauses (else words) into <= max_chars spans"""
+        while end - start > self.max_chars:
+            window = text[start:start + self.max_chars]
+            cut = max(window.rfind(", "), window.rfind("; "), window.rfind(": ")) + 1
+            kind = "clause"
+            if cut <= self.max_chars // 2:
+                cut, kind = window.rfind(" "), "word"
+                if cut <= 0:
+                    cut, kind = self.max_chars, "hard"
+            yield start, start + cut, kind
+            start += cut
+        yield start, end, None
+
+    def split(self, text):
+        """Chunk the text; returns (chunks, stats)"""
+        chunks = []
+        boundaries = Counter()
+        chunk_start = chunk_end = None
+
+        def flush(kind):
+            chunk = text[chunk_start:chunk_end].strip()
+            if chunk:
+                chunks.append(chunk)
+                if kind:
+                    boundaries[kind] += 1
+
+        for start, end, ending in self._sentences(text):
+            if end - start > self.max_chars:
+                if chunk_start is not None:
+                    flush("size")
+                for chunk_start, chunk_end, kind in self._pieces(text, start, end):
+                    if kind:
+                        flush(kind)
+            elif chunk_start is not None and end - chunk_start > self.max_chars:
+                flush("size")
+                chunk_start, chunk_end = start, end
+            else:
+                if chunk_start is None:
+                    chunk_start = start
+                chunk_end = end
+            if ending == "end" or chunk_end - chunk_start < self.min_chars:
+                continue
+            if ending == "paragraph" and chunk_end - chunk_start >= self.paragraph_chars:
+                flush("paragraph")
+            elif zlib.crc32(text[start:end].strip().encode("utf-8")) % self.span < end - start:
+                flush("sentence")
+            else:
+                continue
+            chunk_start = chunk_end = None
+        if chunk_start is not None:
+            flush(None)
+        return chunks, self.stats(chunks, boundaries)
+
+    @staticmethod
+    def stats(chunks, boundaries=None):
+        sizes = [len(chunk) for chunk in chunks]
+        return {
+            "chunks": len(chunks),
+            "chars": sum(sizes),
+            "min_chars": min(sizes, default=0),
+            "mean_chars": round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+            "max_chars": max(sizes, default=0),
+            "boundaries": dict(boundaries or {}),
+        }
+
+
+def _longer_text(text, ocr_text):
+    """The page's text layer or its OCR text, whichever has more content"""
+    return ocr_text if len(ocr_text.strip()) > len(text.strip()) else text
+
+
+class OCRPageCache:
+    """OCR text per (PDF hash, page, DPI, language), so re-runs skip Tesseract"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, "ocr")
+
+    def _entry_path(self, pdf_hash, page_num, dpi, lang):
+        return os.path.join(self.cache_dir, pdf_hash, f"{page_num}_{dpi}_{lang}.txt")
+
+    def get(self, pdf_hash, page_num, dpi, lang):
+        try:
+            with open(self._entry_path(pdf_hash, page_num, dpi, lang), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, pdf_hash, page_num, dpi, lang, text):
+        path = self._entry_path(pdf_hash, page_num, dpi, lang)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+class BoilerplateFilter:
+    """Cross-page removal of running headers, footers and page numbers.
+
+    Builds a frequency index of the lines (with digits folded, so "page 12"
+    and "page 13" match) and leading/trailing word n-grams found at page
+    edges. An edge line or n-gram repeated on at least MIN_REPEATS pages
+    and MIN_SHARE of the pages - within the current chapter, across the
+    book so far, or in a sample primed from across the book (so short
+    opening chapters are cleaned too) - is stripped, as are bare page
+    numbers. Counts accumulate over a book, so use one filter per book.
+    """
+
+    EDGE_LINES = 3
+    MIN_REPEATS = 3
+    MIN_SHARE = 0.4
+    NGRAM_SIZES = (8, 7, 6, 5, 4, 3, 2)  # longest match wins
+
+    def __init__(self):
+        self.book_counts = Counter()
+        self.book_pages = 0
+        self.sample_counts = Counter()
+        self.sample_pages = 0
+        self.chars_in = 0
+        self.chars_removed = 0
+        self.lines_removed = 0
+
+    @staticmethod
+    def _words(line):
+        return re.sub(r'\d+', '#', line.lower()).split()
+
+    def _edge_keys(self, lines):
+        keys = set()
+        for line in lines[:self.EDGE_LINES]:
+            keys.add(("top", " ".join(self._words(line))))
+        for line in lines[-self.EDGE_LINES:]:
+            keys.add(("bottom", " ".join(self._words(line))))
+        if lines:
+            head, tail = self._words(lines[0]), self._words(lines[-1])
+            for n in self.NGRAM_SIZES:
+                if len(head) > n:
+                    keys.add(("head", " ".join(head[:n])))
+                if len(tail) > n:
+                    keys.add(("tail", " ".join(tail[-n:])))
+        return keys
+
+    def prime(self, page_texts):
+        """Count edge lines of sample pages (e.g. spread over the book) without stripping"""
+        for text in page_texts:
+            self.sample_counts.update(self._edge_keys([line for line in text.splitlines() if line.strip()]))
+        self.sample_pages += len(page_texts)
+
+    def strip_pages(self, page_texts):
+        """Clean one chapter's pages; returns (pages, chars_removed, lines_removed)"""
+        pages = [[line for line in text.splitlines() if line.strip()] for text in page_texts]
+        chapter_counts = Counter()
+        for lines in pages:
+            keys = self._edge_keys(lines)
+            chapter_counts.update(keys)
+            self.book_counts.update(keys)
+        self.book_pages += len(pages)
+
+        def repeated(key):
+            for count, total in ((chapter_counts[key], len(pages)),
+                                 (self.book_counts[key], self.book_pages),
+                                 (self.sample_counts[key], self.sample_pages)):
+                if count >= self.MIN_REPEATS and count >= self.MIN_SHARE * total:
+                    return True
+            return False
+
+        def strip_ngram(line, edge):
+            words = line.split()
+            for n in self.NGRAM_SIZES:
+                if len(words) <= n:
+                    continue
+                part = words[:n] if edge == "head" else words[-n:]
+                if repeated((edge, " ".join(self._words(" ".join(part))))):
+                    return " ".join(words[n:] if edge == "head" else words[:-n])
+            return line
+
+        cleaned = []
+        chars_removed = 0
+        lines_removed = 0
+        for lines in pages:
+            for edge in (0, -1):
+                for _ in range(self.EDGE_LINES):
+                    if lines and (PAGE_NUMBER_RE.match(lines[edge].strip())
+                                  or repeated(("top" if edge == 0 else "bottom", " ".join(self._words(lines[edge]))))):
+                        chars_removed += len(lines.pop(edge).strip())
+                        lines_removed += 1
+            if lines:
+                for edge, position in (("head", 0), ("tail", -1)):
+                    line = lines[position]
+                    lines[position] = strip_ngram(line, edge)
+                    chars_removed += len(line.strip()) - len(lines[position])
+            cleaned.append("\n".join(lines))
+        self.chars_in += sum(len(text) for text in page_texts)
+        self.chars_removed += chars_removed
+        self.lines_removed += lines_removed
+        return cleaned, chars_removed, lines_removed
+
+    def stats(self):
+        return {
+            "pages": self.book_pages,
+            "chars_in": self.chars_in,
+            "chars_removed": self.chars_removed,
+            "lines_removed": self.lines_removed,
+            "removed_share": round(self.chars_removed / self.chars_in, 4) if self.chars_in else 0.0,
+        }
+
+
+class ChapterIndexCache:
+    """Chapter index (titles + page ranges) per PDF hash, so re-opening a book is instant.
+
+    Empty indexes (no page had text, e.g. a scan read without OCR) are
+    never stored or reused, so a later run can still find the chapters.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, "index")
+
+    def _entry_path(self, pdf_hash):
+        return os.path.join(self.cache_dir, f"{pdf_hash}.json")
+
+    def get(self, pdf_hash):
+        try:
+            with open(self._entry_path(pdf_hash), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get("version") != self.VERSION or not index.get("chapters"):
+            return None
+        return index
+
+    def put(self, pdf_hash, index):
+        if not index.get("chapters"):
+            return
+        path = self._entry_path(pdf_hash)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(dict(index, version=self.VERSION), f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+def process_rss(pid=None):
+    """Current resident set size in bytes of this process (or pid), None if unknown"""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if pid is None:
+        try:
+            import resource
+            # Peak rather than current RSS, but still an upper bound; KiB on Linux, bytes on macOS
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        except (ImportError, AttributeError):
+            pass
+    return None
+
+
+class _PeakMemory:
+    """Samples RSS of this process and its ffmpeg helpers during a merge"""
+
+    def __init__(self, budget_bytes=None):
+        self.budget_bytes = budget_bytes
+        self.started = time.perf_counter()
+        self.start_rss = process_rss() or 0
+        self.peak_rss = self.start_rss
+        self.peak_helper_rss = 0
+
+    def sample(self, *pids):
+        self.peak_rss = max(self.peak_rss, process_rss() or 0)
+        if pids:
+            helpers = sum(process_rss(pid) or 0 for pid in pids)
+            self.peak_helper_rss = max(self.peak_helper_rss, helpers)
+
+    def stats(self, method, window_bytes):
+        self.sample()
+        peak_total = self.peak_rss + self.peak_helper_rss
+        return {
+            "method": method,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "window_bytes": window_bytes,
+            "start_rss_bytes": self.start_rss,
+            "peak_rss_bytes": self.peak_rss,
+            "peak_helper_rss_bytes": self.peak_helper_rss,
+            "memory_budget_bytes": self.budget_bytes,
+            "within_budget": peak_total <= self.budget_bytes if self.budget_bytes else None,
+        }
+
+
+class StreamingAudioMerger:
+    """Decode-free audio concatenation.
+
+    When every input is an MP3 with the same MPEG version, sample rate and
+    channel layout, frames are copied straight through (plus generated
+    silent frames for gaps, and global_gain rewrites for gain_db) -
+    constant memory and no encode at all. Otherwise a single ffmpeg concat
+    pipeline re-encodes once. The legacy pydub path is kept for
+    ``mode="decode"`` and for hosts without ffmpeg.
+
+    With ``memory_budget_mb`` set, assembly never holds more than a small
+    window of audio: inputs that can't be frame-copied are decoded one at a
+    time by ffmpeg and streamed as PCM blocks (sized from the budget) into
+    a single encoder, and the whole-book pydub path is refused. Every merge
+    reports its peak memory in the ``stats`` dict it is given.
+    """
+
+    # Frames copied between RSS samples (about 30-100 s of audio)
+    SAMPLE_EVERY_FRAMES = 4096
+
+    def __init__(self, bitrate="192k", mode="stream", ffmpeg_path=None, memory_budget_mb=None):
+        self.bitrate = bitrate
+        self.mode = mode
+        self.ffmpeg_path = ffmpeg_path or shutil.which("ffmpeg")
+        self.memory_budget_mb = memory_budget_mb
+
+    @property
+    def memory_budget_bytes(self):
+        return int(self.memory_budget_mb * 1024 * 1024) if self.memory_budget_mb else None
+
+    def merge(self, input_paths, output_path, gap_ms=0, gain_db=0.0, stats=None):
+        """Concatenate input_paths into output_path (MP3), gain_db applied.
+
+        Returns the method used ("copy", "ffmpeg", "pcm" or "decode"), or
+        None if nothing could be written. If stats is a dict it is filled
+        with the method, timing and peak memory of the merge.
+        """
+        input_paths = [path for path in input_paths if os.path.exists(path)]
+        if not input_paths:
+            return None
+        budget = self.memory_budget_bytes
+        memory = _PeakMemory(budget)
+        method, window = None, 0
+        if self.mode == "stream" or budget:
+            infos = [probe_mp3(path) for path in input_paths]
+            if all(infos) and len({_stream_signature(info) for info in infos}) == 1:
+                method, window = "copy", self._merge_frames(input_paths, output_path, gap_ms, gain_db,
+                                                            infos[0], memory)
+            elif budget and self.ffmpeg_path:
+                method, window = "pcm", self._merge_pcm(input_paths, output_path, gap_ms, gain_db, memory)
+            elif budget:
+                raise RuntimeError("memory-bounded merging of mixed audio formats needs ffmpeg")
+            elif self.ffmpeg_path:
+                method = "ffmpeg"
+                self._merge_ffmpeg(input_paths, output_path, gap_ms, gain_db)
+        if method is None:
+            method = "decode"
+            self._merge_decode(input_paths, output_path, gap_ms, gain_db)
+        if stats is not None:
+            stats.update(memory.stats(method, window))
+        return method
+
+    def transcode(self, input_paths, output_path, output_args, gap_ms=0, gain_db=0.0,
+                  extra_inputs=(), stats=None):
+        """Decode input_paths in order and encode them once with output_args.
+
+        Uses the same bounded PCM relay as memory-capped merging: one
+        decoder at a time feeding a single ffmpeg encoder. extra_inputs are
+        inserted after the PCM input (e.g. an ffmetadata file carrying
+        chapters). Needs ffmpeg.
+        """
+        if not self.ffmpeg_path:
+            raise RuntimeError("ffmpeg is required for this output format")
+        input_paths = [path for path in input_paths if os.path.exists(path)]
+        if not input_paths:
+            return None
+        memory = _PeakMemory(self.memory_budget_bytes)
+        window = self._merge_pcm(input_paths, output_path, gap_ms, gain_db, memory,
+                                 output_args=output_args, extra_inputs=extra_inputs)
+        if stats is not None:
+            stats.update(memory.stats("pcm", window))
+        return "pcm"
+
+    def _merge_frames(self, input_paths, output_path, gap_ms, gain_db, reference, memory):
+        silence = b""
+        if gap_ms > 0:
+            frame_count = -(-int(gap_ms * reference.sample_rate) // (1000 * reference.samples))
+            silence = make_silent_mp3_frame(reference) * frame_count
+        steps = round(gain_db / MP3_GAIN_STEP_DB)
+        block_size = 1 << 16
+        copied = 0
+        with open(output_path, "wb") as out:
+            for idx, path in enumerate(input_paths):
+                if idx and silence:
+                    out.write(silence)
+                for info, frame in iter_mp3_frames(path, block_size):
+                    out.write(adjust_mp3_frame_gain(frame, info, steps) if steps else frame)
+                    copied += 1
+                    if copied % self.SAMPLE_EVERY_FRAMES == 0:
+                        memory.sample()
+        return block_size + len(silence)
+
+    def _pcm_block_bytes(self, frame_bytes, rss):
+        """PCM bytes relayed per read: 1 MiB, less when the budget is tight"""
+        block = 1 << 20
+        budget = self.memory_budget_bytes
+        if budget:
+            # Reads, pipe buffers and the writer's copy each hold up to a block
+            block = max(64 * 1024, min(block, (budget - rss) // 8))
+        return block - block % frame_bytes
+
+    def _merge_pcm(self, input_paths, output_path, gap_ms, gain_db, memory, output_args=None, extra_inputs=()):
+        sample_rate, channels = _probe_audio_format(input_paths[0])
+        frame_bytes = 2 * channels
+        block = self._pcm_block_bytes(frame_bytes, memory.start_rss)
+        pcm = ["-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels)]
+        volume = ["-af", f"volume={gain_db:.2f}dB"] if gain_db else []
+        base = [self.ffmpeg_path, "-hide_banner", "-loglevel", "error"]
+        output_args = output_args or ["-c:a", "libmp3lame", "-b:a", self.bitrate]
+        encoder = subprocess.Popen(
+            base + ["-y"] + pcm + ["-i", "pipe:0"] + list(extra_inputs) + list(output_args) + [output_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            for idx, path in enumerate(input_paths):
+                if idx and gap_ms > 0:
+                    remaining = int(gap_ms * sample_rate / 1000) * frame_bytes
+                    zeros = memoryview(bytes(min(block, remaining)))
+                    while remaining:
+                        count = min(len(zeros), remaining)
+                        encoder.stdin.write(zeros[:count])
+                        remaining -= count
+                decoder = subprocess.Popen(
+                    base + ["-i", path] + volume + pcm + ["pipe:1"],
+                    stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                )
+                try:
+                    for data in iter(lambda: decoder.stdout.read(block), b""):
+                        encoder.stdin.write(data)
+                        memory.sample(encoder.pid, decoder.pid)
+                finally:
+                    decoder.stdout.close()
+                    if decoder.wait() != 0:
+                        raise subprocess.CalledProcessError(decoder.returncode, "ffmpeg decode " + path)
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise subprocess.CalledProcessError(encoder.returncode, "ffmpeg encode " + output_path)
+        except BaseException:
+            encoder.kill()
+            encoder.wait()
+            raise
+        return block
+
+    def _merge_ffmpeg(self, input_paths, output_path, gap_ms, gain_db):
+        sample_rate, channels = _probe_audio_format(input_paths[0])
+        layout = "mono" if channels == 1 else "stereo"
+        cmd = [self.ffmpeg_path, "-hide_banner", "-loglevel", "error", "-y"]
+        filters = []
+        labels = []
+        stream_idx = 0
+        for idx, path in enumerate(input_paths):
+            if idx and gap_ms > 0:
+                cmd += ["-f", "lavfi", "-t", f"{gap_ms / 1000:.3f}",
+                        "-i", f"anullsrc=r={sample_rate}:cl={layout}"]
+                labels.append(f"[{stream_idx}:a]")
+                stream_idx += 1
+            cmd += ["-i", path]
+            # Bring every input to the same format before concatenating
+            filters.append(f"[{stream_idx}:a]aresample={sample_rate},"
+                           f"aformat=channel_layouts={layout}[a{stream_idx}]")
+            labels.append(f"[a{stream_idx}]")
+            stream_idx += 1
+        concat = "".join(labels) + f"concat=n={len(labels)}:v=0:a=1"
+        concat += f",volume={gain_db:.2f}dB[out]" if gain_db else "[out]"
+        graph = ";".join(filters + [concat])
+        cmd += ["-filter_complex", graph, "-map", "[out]",
+                "-c:a", "libmp3lame", "-b:a", self.bitrate, output_path]
+        subprocess.run(cmd, check=True, capture_output=True)
+
+    def _merge_decode(self, input_paths, output_path, gap_ms, gain_db):
+        from pydub import AudioSegment
+        combined = AudioSegment.empty()
+        for idx, path in enumerate(input_paths):
+            if idx and gap_ms > 0:
+                combined += AudioSegment.silent(duration=gap_ms)
+            combined += AudioSegment.from_file(path)
+        if gain_db:
+            combined = combined.apply_gain(gain_db)
+        combined.export(output_path, format="mp3", bitrate=self.bitrate)
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` requests per second, bursts up to ``burst``"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; returns how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # A negative balance queues callers behind the ones already waiting
+            return max(0.0, -self._tokens / self.rate)
+
+
+def _http_status(exc):
+    """HTTP status carried by an engine error (urllib, requests, aiohttp, gTTS), if any"""
+    for source in (exc, getattr(exc, "rsp", None), getattr(exc, "response", None)):
+        for attr in ("status", "code", "status_code"):
+            value = getattr(source, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def _retry_after(exc):
+    for source in (exc, getattr(exc, "rsp", None), getattr(exc, "response", None)):
+        headers = getattr(source, "headers", None)
+        if headers is not None:
+            try:
+                return float(headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class RequestScheduler:
+    """Rate limits, retries and adaptive concurrency for one online engine.
+
+    Every request takes a token from the engine's ``TokenBucket``. Failures
+    are retried with exponential backoff and full jitter (honouring
+    Retry-After), except configuration errors (ImportError, ValueError,
+    TypeError). Concurrency follows AIMD: the window grows by about one
+    slot per window of successes up to ``max_concurrency`` and halves -
+    at most once per ``backoff`` seconds - on a 429/503 or other error.
+    ``call`` blocks; ``call_async`` is its asyncio twin. Both return
+    ``(ok, attempts, error)``.
+    """
+
+    THROTTLE_STATUSES = (429, 503)
+    FATAL_ERRORS = (ImportError, ValueError, TypeError)
+
+    def __init__(self, engine, bucket=None, max_concurrency=4, min_concurrency=1, retries=4,
+                 backoff=0.5, max_backoff=30.0, metrics=None):
+        self.engine = engine
+        self.bucket = bucket
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = min(max(1, int(min_concurrency)), self.max_concurrency)
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = metrics
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._async_waiters = deque()
+        self.stats = Counter()
+
+    def _classify(self, ok, error):
+        if ok:
+            return "ok"
+        if isinstance(error, self.FATAL_ERRORS):
+            return "fatal"
+        if _http_status(error) in self.THROTTLE_STATUSES:
+            return "throttled"
+        return "error"
+
+    def _try_enter(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _leave(self, outcome):
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["requests"] += 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            else:
+                self.stats[outcome] += 1
+                now = time.monotonic()
+                if outcome != "fatal" and now - self._decreased >= self.backoff:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self._decreased = now
+            self._slot_freed.notify_all()
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+        if self.metrics is not None and outcome != "ok":
+            self.metrics.inc("tts_request_errors", engine=self.engine, kind=outcome)
+
+    def _delay(self, attempt, error):
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(self.max_backoff, retry_after) + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _attempts(self):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.stats["retries"] += 1
+                if self.metrics is not None:
+                    self.metrics.inc("tts_retries", engine=self.engine)
+            yield attempt
+
+    def call(self, fn, *args):
+        """Run fn(*args) (True on success, or raises) under the limits, with retries"""
+        error = None
+        attempts = 0
+        for attempt in self._attempts():
+            attempts += 1
+            with self._slot_freed:
+                while not self._try_enter():
+                    self._slot_freed.wait()
+            if self.bucket is not None:
+                time.sleep(self.bucket.reserve())
+            ok = False
+            try:
+                ok = bool(fn(*args))
+                error = None if ok else RuntimeError(f"{self.engine} returned no audio")
+            except Exception as e:
+                error = e
+            outcome = self._classify(ok, error)
+            self._leave(outcome)
+            if ok:
+                return True, attempts, None
+            if outcome == "fatal" or attempt == self.retries:
+                break
+            time.sleep(self._delay(attempt, error))
+        with self._lock:
+            self.stats["failed"] += 1
+        return False, attempts, error
+
+    async def call_async(self, fn, *args):
+        """``call`` for a coroutine function, without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        error = None
+        attempts = 0
+        for attempt in self._attempts():
+            attempts += 1
+            while True:
+                with self._lock:
+                    if self._try_enter():
+                        break
+                    waiter = loop.create_future()
+                    self._async_waiters.append((loop, waiter))
+                await waiter
+            if self.bucket is not None:
+                await asyncio.sleep(self.bucket.reserve())
+            ok = False
+            try:
+                ok = bool(await fn(*args))
+                error = None if ok else RuntimeError(f"{self.engine} returned no audio")
+            except Exception as e:
+                error = e
+            outcome = self._classify(ok, error)
+            self._leave(outcome)
+            if ok:
+                return True, attempts, None
+            if outcome == "fatal" or attempt == self.retries:
+                break
+            await asyncio.sleep(self._delay(attempt, error))
+        with self._lock:
+            self.stats["failed"] += 1
+        return False, attempts, error
+
+
+def _pyttsx3_worker(conn):
+    """Worker process: owns one pyttsx3 engine and synthesizes the chunks sent over conn"""
+    try:
+        import pyttsx3
+        engine = pyttsx3.init()
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", None))
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        if message == "ping":
+            conn.send(("pong", None))
+            continue
+        text, output_path, rate = message
+        try:
+            engine.setProperty('rate', rate)
+            engine.setProperty('volume', 0.9)
+            engine.save_to_file(text, output_path)
+            engine.runAndWait()
+            if os.path.exists(output_path) and os.path.getsize(output_path):
+                conn.send(("done", None))
+            else:
+                conn.send(("error", "pyttsx3 wrote no audio"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Pyttsx3Process:
+    def __init__(self, context, name):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_pyttsx3_worker, args=(child,), name=name, daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+
+    def stop(self, timeout=2.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class Pyttsx3WorkerPool:
+    """Long-lived worker processes, each with its own initialized pyttsx3 engine.
+
+    pyttsx3 engines are neither thread-safe nor parallel within a process,
+    so offline synthesis scales across cores by handing each chunk to an
+    idle worker process. A worker that died is restarted before its next
+    chunk, and one whose ``runAndWait`` exceeds ``timeout`` seconds is
+    killed and replaced (the chunk raises TimeoutError). ``health_check``
+    pings the idle workers and restarts unresponsive ones.
+    """
+
+    def __init__(self, workers=None, timeout=120.0, start_timeout=30.0, metrics=None):
+        self.size = max(1, int(workers or os.cpu_count() or 1))
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.metrics = metrics
+        self.restarts = 0
+        # Set when pyttsx3 cannot start at all (not installed, no speech backend)
+        self.init_error = None
+        self._context = _worker_context()
+        self._idle = queue.Queue()
+        self._workers = 0
+        self._lock = threading.Lock()
+        self._spawned = 0
+
+    def _spawn(self):
+        self._spawned += 1
+        return _Pyttsx3Process(self._context, f"pyttsx3-worker-{self._spawned}")
+
+    def start(self):
+        """Start the worker processes (engines initialize in parallel)"""
+        with self._lock:
+            while self._workers < self.size:
+                self._idle.put(self._spawn())
+                self._workers += 1
+
+    def _restart(self, worker, reason):
+        logger.warning("Restarting pyttsx3 worker %s (%s)", worker.process.name, reason)
+        worker.process.kill()
+        worker.stop()
+        self.restarts += 1
+        if self.metrics is not None:
+            self.metrics.inc("pyttsx3_worker_restarts", reason=reason)
+        with self._lock:
+            return self._spawn()
+
+    def _wait_ready(self, worker):
+        if not worker.conn.poll(self.start_timeout):
+            raise TimeoutError(f"pyttsx3 worker did not start within {self.start_timeout}s")
+        status, error = worker.conn.recv()
+        if status != "ready":
+            self.init_error = error
+            raise RuntimeError(f"pyttsx3 failed to start: {error}")
+        worker.ready = True
+
+    def synthesize(self, text, output_path, voice_settings=None):
+        """Synthesize one chunk in an idle worker; raises on failure"""
+        if self.init_error:
+            raise RuntimeError(f"pyttsx3 failed to start: {self.init_error}")
+        self.start()
+        rate = voice_settings.get('rate', 180) if voice_settings else 180
+        worker = self._idle.get()
+        try:
+            if not worker.process.is_alive():
+                worker = self._restart(worker, "died")
+            try:
+                if not worker.ready:
+                    self._wait_ready(worker)
+                worker.conn.send((text, output_path, rate))
+                finished = worker.conn.poll(self.timeout)
+                if finished:
+                    status, error = worker.conn.recv()
+            except TimeoutError:
+                worker = self._restart(worker, "hung")
+                raise
+            except (EOFError, OSError) as e:
+                worker.process.join(1.0)
+                exitcode = worker.process.exitcode
+                worker = self._restart(worker, "died")
+                raise RuntimeError(f"pyttsx3 worker exited with code {exitcode}") from e
+            if not finished:
+                worker = self._restart(worker, "hung")
+                raise TimeoutError(f"pyttsx3 runAndWait hung for over {self.timeout}s")
+            if status != "done":
+                raise RuntimeError(error)
+            return True
+        finally:
+            self._idle.put(worker)
+
+    def health_check(self, timeout=5.0):
+        """Ping idle workers, restarting dead or unresponsive ones; returns counts"""
+        checked = []
+        restarted = 0
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                healthy = worker.process.is_alive()
+                if healthy and not worker.ready:
+                    self._wait_ready(worker)
+                if healthy:
+                    worker.conn.send("ping")
+                    healthy = worker.conn.poll(timeout) and worker.conn.recv()[0] == "pong"
+            except RuntimeError:
+                # pyttsx3 itself cannot start; restarting would not help
+                healthy = True
+            except (TimeoutError, EOFError, OSError):
+                healthy = False
+            if not healthy:
+                worker = self._restart(worker, "unhealthy")
+                restarted += 1
+            checked.append(worker)
+        for worker in checked:
+            self._idle.put(worker)
+        return {"workers": self._workers, "checked": len(checked), "restarted": restarted,
+                "init_error": self.init_error}
+
+    def close(self):
+        """Stop every worker process"""
+        with self._lock:
+            count, self._workers = self._workers, 0
+        for _ in range(count):
+            self._idle.get().stop()
+
+
+class ChunkSynthesizer:
+    """Concurrent chunk synthesis for one job.
+
+    Edge TTS chunks share a single event loop (running in a background
+    thread) and are bounded by a semaphore; blocking engines run on a thread
+    pool. ``submit`` returns a ``concurrent.futures.Future`` resolving to the
+    engine's success flag, so callers can wait on chunks in their original
+    order no matter which one finishes first. Chunks already present in the
+    converter's ``chunk_cache`` resolve immediately without touching the engine.
+    """
+
+    def __init__(self, converter, tts_method, voice_settings=None, concurrency=None):
+        self.converter = converter
+        if tts_method in converter.custom_engines:
+            self.engine = tts_method
+        else:
+            self.engine = normalize_engine_name(tts_method)
+        self.voice_settings = voice_settings or {}
+        self.cache = converter.chunk_cache
+        self.settings = engine_settings(self.engine, self.voice_settings)
+        if concurrency is None:
+            concurrency = converter.concurrency.get(self.engine, 1)
+        self.concurrency = max(1, int(concurrency))
+        # pyttsx3 runs in-process when serial, else on the converter's worker processes
+        self.pyttsx3_pool = None
+        if self.engine == "pyttsx3" and self.concurrency > 1:
+            self.pyttsx3_pool = converter.pyttsx3_pool(self.concurrency)
+        # Online engines go through a rate-limited, retrying, AIMD scheduler
+        self.scheduler = None
+        limit = converter.rate_limits.get(self.engine)
+        if limit is not None:
+            policy = {key: value for key, value in limit.items() if key not in ("rate", "burst")}
+            self.scheduler = RequestScheduler(self.engine, converter.token_bucket(self.engine),
+                                              max_concurrency=self.concurrency, metrics=converter.metrics,
+                                              **policy)
+        # Chunks that failed after all retries: output_path -> record
+        self.failures = {}
+        self._loop = None
+        self._loop_thread = None
+        self._semaphore = None
+        self._executor = None
+        # Audio length of every finished chunk, measured as it is written
+        self.durations = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def start(self):
+        """Spin up the event loop or thread pool for this job"""
+        if self.engine == "Edge":
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._loop_thread.start()
+                self._semaphore = asyncio.run_coroutine_threadsafe(
+                    self._make_semaphore(), self._loop
+                ).result()
+        elif self._executor is None:
+            if self.pyttsx3_pool is not None:
+                self.pyttsx3_pool.start()
+                self.pyttsx3_pool.health_check()
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                thread_name_prefix=f"tts-{self.engine}")
+
+    def close(self):
+        """Wait for outstanding chunks and release the loop / pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = None
+            self._loop_thread = None
+            self._semaphore = None
+
+    async def _make_semaphore(self):
+        return asyncio.Semaphore(self.concurrency)
+
+    async def _edge_chunk(self, text, output_path, cache_key, on_ready=None):
+        async with self._semaphore:
+            started = time.perf_counter()
+            args = (text, output_path, self.settings['edge_voice'])
+            if self.scheduler is not None:
+                success, attempts, error = await self.scheduler.call_async(self.converter._edge_tts_save, *args)
+            else:
+                attempts, error = 1, None
+                try:
+                    success = await self.converter._edge_tts_save(*args)
+                except Exception as e:
+                    success, error = False, e
+            if not success:
+                self._record_failure(output_path, text, attempts, error)
+            self.converter.metrics.observe_tts(self.engine, started, time.perf_counter(), len(text), success)
+        if success:
+            await self._loop.run_in_executor(None, self._finish_chunk, output_path, cache_key, on_ready)
+        return success
+
+    def _finish_chunk(self, output_path, cache_key, on_ready=None):
+        self.failures.pop(output_path, None)
+        self.record_duration(output_path)
+        if cache_key:
+            self.cache.store(cache_key, output_path)
+        if on_ready is not None:
+            # Before the future resolves, so the file can't be merged away yet
+            try:
+                on_ready(output_path)
+            except Exception as e:
+                logger.warning("Chunk ready hook failed: %s", e)
+
+    def record_duration(self, output_path, seconds=None):
+        """Remember a chunk's length (measured from the file unless given)"""
+        if seconds is None:
+            seconds = audio_duration(output_path)
+        self.durations[output_path] = seconds
+
+    def duration(self, output_path):
+        """Seconds of audio in a finished chunk, None if unknown"""
+        return self.durations.get(output_path)
+
+    def _record_failure(self, output_path, text, attempts, error):
+        logger.warning("%s chunk failed after %d attempt(s): %s", self.engine, attempts, error or "no audio")
+        self.failures[output_path] = {
+            "engine": self.engine,
+            "chars": len(text),
+            "attempts": attempts,
+            "status": _http_status(error),
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+        }
+
+    def failure(self, output_path):
+        """Why a chunk failed after its retries (None if it didn't)"""
+        return self.failures.get(output_path)
+
+    def _blocking_chunk(self, text, output_path, cache_key, on_ready=None):
+        started = time.perf_counter()
+        if self.engine in self.converter.custom_engines:
+            engine_fn, args = self.converter.custom_engines[self.engine], (text, output_path, self.voice_settings)
+        elif self.engine == "gTTS":
+            engine_fn, args = self.converter._gtts_save, (text, output_path, self.settings['language'])
+        elif self.pyttsx3_pool is not None:
+            engine_fn, args = self.pyttsx3_pool.synthesize, (text, output_path, self.voice_settings)
+        else:
+            engine_fn, args = self.converter.generate_with_pyttsx3_fast, (text, output_path, self.voice_settings)
+        if self.scheduler is not None:
+            success, attempts, error = self.scheduler.call(engine_fn, *args)
+        else:
+            attempts, error = 1, None
+            try:
+                success = bool(engine_fn(*args))
+            except Exception as e:
+                success, error = False, e
+        if not success:
+            self._record_failure(output_path, text, attempts, error)
+        self.converter.metrics.observe_tts(self.engine, started, time.perf_counter(), len(text), success)
+        if success:
+            self._finish_chunk(output_path, cache_key, on_ready)
+        return success
+
+    def submit(self, text, output_path, on_ready=None):
+        """Schedule one chunk; returns a Future resolving to True/False.
+
+        ``on_ready(output_path)`` runs once the chunk's audio is complete,
+        before the future resolves (e.g. to publish a streaming preview).
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(text, self.engine, self.settings)
+            if self.cache.fetch(cache_key, output_path):
+                self.converter.metrics.inc("tts_chunks", engine=self.engine, result="cached")
+                self._finish_chunk(output_path, None, on_ready)
+                future = Future()
+                future.set_result(True)
+                return future
+        self.start()
+        if self.engine == "Edge":
+            return asyncio.run_coroutine_threadsafe(
+                self._edge_chunk(text, output_path, cache_key, on_ready), self._loop
+            )
+        return self._executor.submit(self._blocking_chunk, text, output_path, cache_key, on_ready)
+
+    def synthesize_all(self, chunks, output_paths):
+        """Synthesize every chunk concurrently; results come back in input order"""
+        futures = [self.submit(chunk, path) for chunk, path in zip(chunks, output_paths)]
+        return [self.result(future) for future in futures]
+
+    @staticmethod
+    def result(future):
+        """Success flag of a submitted chunk (engine errors count as failure)"""
+        try:
+            return bool(future.result())
+        except Exception:
+            return False
+
+# Worker threads per pipeline stage; synthesis parallelism itself comes from
+# ChunkSynthesizer's per-engine concurrency
+DEFAULT_PIPELINE_WORKERS = {
+    "extract": 1,
+    "prepare": 1,
+    "synthesize": 1,
+    "encode": 2,
+}
+
+
+def _attach_streamlit_context(thread):
+    """Let worker threads update Streamlit widgets of the current session"""
+    try:
+        from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
+    except Exception:
+        pass
+
+
+class StreamingPreview:
+    """In-order publishing of synthesized chunks as an HLS-style playlist.
+
+    Chunks finish out of order; each one is hard-linked into ``directory``
+    as soon as its audio is complete (``stage``), and segments are appended
+    to ``playlist.m3u8`` strictly in book order once everything before them
+    is there, so a player can start on the first chunk while the rest of
+    the book is still being synthesized. ``expect`` tells the publisher how
+    many chunks a chapter has (0 for chapters with nothing to play) and
+    ``skip`` passes over a chunk that failed. ``callback(segment)`` is
+    called for every published segment from a delivery thread that may
+    update the Streamlit session. ``finish`` adds #EXT-X-ENDLIST.
+    """
+
+    def __init__(self, directory, callback=None, metrics=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.playlist_path = os.path.join(directory, "playlist.m3u8")
+        self.callback = callback
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.first_audio_seconds = None
+        self.segments = []
+        self.finished = False
+        self._chapters = {}    # idx -> {"title", "chunks": [None | segment | False]}
+        self._cursor = (0, 0)  # next (chapter, chunk) to publish
+        self._lock = threading.Lock()
+        self._write_playlist()
+        self._events = None
+        if callback is not None:
+            self._events = queue.Queue()
+            self._delivery = threading.Thread(target=self._deliver, name="preview-delivery", daemon=True)
+            _attach_streamlit_context(self._delivery)
+            self._delivery.start()
+
+    def _deliver(self):
+        while True:
+            segment = self._events.get()
+            if segment is None:
+                return
+            try:
+                self.callback(segment)
+            except Exception as e:
+                logger.warning("Preview callback failed: %s", e)
+
+    def _chapter(self, idx):
+        return self._chapters.setdefault(idx, {"title": None, "chunks": None})
+
+    def expect(self, idx, count, title=None):
+        """Chapter idx will have `count` chunks"""
+        with self._lock:
+            chapter = self._chapter(idx)
+            chapter["title"] = title
+            if chapter["chunks"] is None:
+                chapter["chunks"] = [None] * count
+            self._advance()
+
+    def stage(self, idx, chunk_idx, path, duration=None):
+        """Chunk audio is complete: link it into the preview and publish what is in order"""
+        name = f"seg_{idx:04d}_{chunk_idx:04d}{os.path.splitext(path)[1] or '.mp3'}"
+        segment_path = os.path.join(self.directory, name)
+        _link_or_copy(path, segment_path)
+        if duration is None:
+            duration = audio_duration(segment_path)
+        with self._lock:
+            self._chapter(idx).setdefault("staged", {})[chunk_idx] = {
+                "chapter": idx, "chunk": chunk_idx, "path": segment_path, "uri": name, "duration": duration,
+            }
+            self._advance()
+
+    def skip(self, idx, chunk_idx):
+        """Chunk failed: publish past it"""
+        with self._lock:
+            self._chapter(idx).setdefault("staged", {})[chunk_idx] = False
+            self._advance()
+
+    def _advance(self):
+        published = []
+        while True:
+            idx, chunk_idx = self._cursor
+            chapter = self._chapters.get(idx)
+            if chapter is None or chapter["chunks"] is None:
+                break
+            if chunk_idx >= len(chapter["chunks"]):
+                self._cursor = (idx + 1, 0)
+                continue
+            segment = chapter.get("staged", {}).get(chunk_idx)
+            if segment is None:
+                break
+            if segment:
+                segment = dict(segment, index=len(self.segments), title=chapter["title"],
+                               playlist=self.playlist_path)
+                self.segments.append(segment)
+                published.append(segment)
+            self._cursor = (idx, chunk_idx + 1)
+        if not published:
+            return
+        if self.first_audio_seconds is None:
+            self.first_audio_seconds = time.perf_counter() - self.started
+            if self.metrics is not None:
+                self.metrics.observe_stage("first_audio", self.first_audio_seconds)
+        self._write_playlist()
+        if self._events is not None:
+            for segment in published:
+                self._events.put(segment)
+
+    def _write_playlist(self):
+        durations = [segment["duration"] or 0.0 for segment in self.segments]
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(durations, default=1.0))}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for segment, duration in zip(self.segments, durations):
+            title = (segment["title"] or "").replace(",", " ")
+            lines.append(f"#EXTINF:{duration:.3f},{title}")
+            lines.append(segment["uri"])
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+        tmp_path = self.playlist_path + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+    def finish(self):
+        """Close the playlist and wait for pending callbacks"""
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            self._write_playlist()
+        if self._events is not None:
+            self._events.put(None)
+            self._delivery.join()
+
+
+class _PipelineAborted(Exception):
+    pass
+
+
+def _new_job_id():
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S_") + hashlib.sha1(os.urandom(8)).hexdigest()[:6]
+
+
+class WorkspaceQuotaError(RuntimeError):
+    pass
+
+
+class JobWorkspace:
+    """Scratch directory of one job; its temp files go away with ``cleanup()``.
+
+    While the job runs, an ``.active`` marker holding the owner's pid keeps
+    the directory safe from eviction by other jobs.
+    """
+
+    def __init__(self, workspace, path, active=True):
+        self.workspace = workspace
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._marker = os.path.join(path, ".active")
+        if active:
+            with open(self._marker, "w") as f:
+                f.write(str(os.getpid()))
+
+    def temp_path(self, suffix="", prefix="tmp"):
+        """A new empty file in the workspace (instead of NamedTemporaryFile)"""
+        fd, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=self.path)
+        os.close(fd)
+        return path
+
+    def check_quota(self):
+        self.workspace.enforce_quota()
+
+    def release(self):
+        """Mark the job finished but keep its files (e.g. for resume)"""
+        if os.path.exists(self._marker):
+            os.remove(self._marker)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Workspace:
+    """Per-job scratch directories under one root, with a disk quota and age eviction.
+
+    ``job()`` first evicts job directories untouched for ``max_age_hours``,
+    then enforces ``quota_mb`` by evicting inactive jobs oldest first and
+    raising WorkspaceQuotaError if that is not enough. Directories of
+    running jobs (live ``.active`` marker) and the job being opened are
+    never evicted. Usage counts
+    every inode once, so outputs hard-linked elsewhere are not double-counted.
+    """
+
+    def __init__(self, root, quota_mb=None, max_age_hours=72):
+        self.root = root
+        self.quota_mb = quota_mb
+        self.max_age_hours = max_age_hours
+
+    @staticmethod
+    def _is_active(path):
+        try:
+            with open(os.path.join(path, ".active")) as f:
+                pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return False
+        if pid == os.getpid():
             return True
-        except Exception as e:
-            st.error(f"Error analyzing voice: {str(e)}")
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
             return False
-    
-    def apply_basic_voice_transfer(self, source_audio_path, output_path):
-        """Fast, basic voice matching"""
+        except OSError:
+            pass  # exists, owned by someone else
+        return True
+
+    def _usage(self, path, seen):
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    st = os.lstat(os.path.join(dirpath, filename))
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+        return total
+
+    def jobs(self):
+        """(path, last modified, bytes, active) of every job directory, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        jobs = []
+        seen = set()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                modified = max(os.stat(os.path.join(path, entry)).st_mtime
+                               for entry in os.listdir(path) + [os.curdir])
+            except OSError:
+                continue
+            jobs.append((path, modified, self._usage(path, seen), self._is_active(path)))
+        return sorted(jobs, key=lambda job: job[1])
+
+    def usage(self):
+        """Bytes used under the root"""
+        return sum(size for _, _, size, _ in self.jobs())
+
+    def _stale(self, jobs, keep=None):
+        if not self.max_age_hours:
+            return []
+        cutoff = time.time() - self.max_age_hours * 3600
+        return [path for path, modified, _, active in jobs if modified < cutoff and not active and path != keep]
+
+    def _over_quota(self, jobs, keep=None):
+        """(inactive jobs to evict oldest first, bytes still used after that)"""
+        used = sum(size for _, _, size, _ in jobs)
+        victims = []
+        if self.quota_mb:
+            quota = self.quota_mb * 1024 * 1024
+            for path, _, size, active in jobs:
+                if used <= quota:
+                    break
+                if not active and path != keep:
+                    victims.append(path)
+                    used -= size
+        return victims, used
+
+    def evict_stale(self, keep=None):
+        """Remove inactive job directories older than max_age_hours (except keep); returns how many"""
+        stale = self._stale(self.jobs(), keep)
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+        return len(stale)
+
+    def enforce_quota(self, keep=None):
+        """Evict inactive jobs (oldest first, never keep) until the root fits the quota"""
+        if not self.quota_mb:
+            return
+        victims, used = self._over_quota(self.jobs(), keep)
+        for path in victims:
+            shutil.rmtree(path, ignore_errors=True)
+        if used > self.quota_mb * 1024 * 1024:
+            raise WorkspaceQuotaError(f"Workspace {self.root} holds {used / 2 ** 20:.0f} MB of running jobs, "
+                                      f"over its {self.quota_mb} MB quota")
+
+    def evictable(self):
+        """Paths of the job directories the next job() call for another job would evict"""
+        jobs = self.jobs()
+        stale = set(self._stale(jobs))
+        victims, _ = self._over_quota([job for job in jobs if job[0] not in stale])
+        return stale | set(victims)
+
+    def job(self, job_id=None, active=True):
+        """Scratch directory for a job (evicting stale jobs and enforcing the quota first).
+
+        The job's own directory is never evicted by this call, so resuming
+        an old or over-quota job keeps its checkpoint.
+        """
+        job = JobWorkspace(self, os.path.join(self.root, job_id or _new_job_id()), active=active)
+        try:
+            self.evict_stale(keep=job.path)
+            self.enforce_quota(keep=job.path)
+        except BaseException:
+            job.release()
+            raise
+        return job
+
+
+class JobManifest:
+    """On-disk checkpoint of a conversion job.
+
+    ``manifest.json`` records every chapter and chunk with its status and
+    output path; chapter text and chunk texts live next to it so a job can
+    be resumed without the original PDF. Chunk and chapter audio is written
+    inside the job directory instead of anonymous temp files.
+    """
+
+    SAVE_INTERVAL = 0.5  # seconds between routine (non-forced) manifest writes
+
+    def __init__(self, job_dir, data):
+        self.job_dir = job_dir
+        self.data = data
+        self._lock = threading.RLock()
+        self._last_save = 0.0
+        self._dirty = False
+
+    @classmethod
+    def create(cls, jobs_dir, settings, job_id=None):
+        job_id = job_id or _new_job_id()
+        job_dir = os.path.join(jobs_dir, job_id)
+        for sub in ("chunks", "chapters", "text"):
+            os.makedirs(os.path.join(job_dir, sub), exist_ok=True)
+        now = time.time()
+        manifest = cls(job_dir, {
+            "job_id": job_id,
+            "status": "running",
+            "created": now,
+            "updated": now,
+            "settings": settings,
+            "extraction_complete": False,
+            "chapters": {},
+        })
+        manifest.save(force=True)
+        return manifest
+
+    @classmethod
+    def load(cls, jobs_dir, job_id):
+        job_dir = os.path.join(jobs_dir, job_id)
+        with open(os.path.join(job_dir, "manifest.json"), encoding="utf-8") as f:
+            return cls(job_dir, json.load(f))
+
+    @property
+    def job_id(self):
+        return self.data["job_id"]
+
+    @property
+    def settings(self):
+        return self.data["settings"]
+
+    def save(self, force=False):
+        """Atomically rewrite manifest.json (throttled unless force=True)"""
+        with self._lock:
+            self._dirty = True
+            now = time.time()
+            if not force and now - self._last_save < self.SAVE_INTERVAL:
+                return
+            self.data["updated"] = now
+            path = os.path.join(self.job_dir, "manifest.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=1)
+            os.replace(tmp_path, path)
+            self._last_save = now
+            self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            if self._dirty:
+                self.save(force=True)
+
+    def set_status(self, status):
+        with self._lock:
+            self.data["status"] = status
+            self.save(force=True)
+
+    # -- chapters ---------------------------------------------------------
+
+    def _chapter(self, idx):
+        return self.data["chapters"].get(str(idx))
+
+    def chapter_indexes(self):
+        return sorted(int(idx) for idx in self.data["chapters"])
+
+    def register_chapter(self, idx, chapter):
+        """Record an extracted chapter and keep its text for resuming"""
+        with self._lock:
+            if self._chapter(idx) is not None:
+                return
+            with open(os.path.join(self.job_dir, "text", f"{idx:04d}.txt"), "w", encoding="utf-8") as f:
+                f.write(chapter['content'])
+            self.data["chapters"][str(idx)] = {
+                "title": chapter['title'],
+                "status": "pending",
+                "output": None,
+                "saved_path": None,
+                "chunks": None,
+            }
+            self.save(force=True)
+
+    def load_chapter(self, idx):
+        """Chapter dict (title + stored text) as it was first extracted"""
+        entry = self._chapter(idx)
+        with open(os.path.join(self.job_dir, "text", f"{idx:04d}.txt"), encoding="utf-8") as f:
+            return {"title": entry["title"], "content": f.read()}
+
+    def chapter_path(self, idx):
+        return os.path.join(self.job_dir, "chapters", f"{idx:04d}.mp3")
+
+    def chapter_done(self, idx):
+        entry = self._chapter(idx)
+        return (entry is not None and entry["status"] in ("done", "empty")
+                and (entry["status"] == "empty" or bool(entry["output"]) and os.path.exists(entry["output"])))
+
+    def mark_chapter(self, idx, audio_file=None, status=None):
+        with self._lock:
+            entry = self._chapter(idx)
+            if audio_file:
+                entry.update(status="done", output=audio_file['path'], saved_path=audio_file['saved_path'],
+                             duration=audio_file.get('duration'))
+            else:
+                entry["status"] = status or "failed"
+            self.save(force=True)
+
+    def audio_file(self, idx):
+        entry = self._chapter(idx)
+        if entry is None or entry["status"] != "done":
+            return None
+        return {'title': entry["title"], 'path': entry["output"], 'saved_path': entry["saved_path"],
+                'duration': entry.get("duration")}
+
+    # -- chunks -----------------------------------------------------------
+
+    def has_chunks(self, idx):
+        entry = self._chapter(idx)
+        return entry is not None and entry["chunks"] is not None
+
+    def set_chunks(self, idx, text_chunks):
+        """Record how a chapter was split; chunk texts are stored once"""
+        with self._lock:
+            with open(os.path.join(self.job_dir, "text", f"{idx:04d}.chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(text_chunks, f)
+            self._chapter(idx)["chunks"] = [
+                {"status": "pending", "path": self.chunk_path(idx, chunk_idx)}
+                for chunk_idx in range(len(text_chunks))
+            ]
+            self.save(force=True)
+
+    def chunk_texts(self, idx):
+        with open(os.path.join(self.job_dir, "text", f"{idx:04d}.chunks.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def chunk_path(self, idx, chunk_idx):
+        return os.path.join(self.job_dir, "chunks", f"{idx:04d}_{chunk_idx:04d}.mp3")
+
+    def chunk_done(self, idx, chunk_idx):
+        chunk = self._chapter(idx)["chunks"][chunk_idx]
+        return chunk["status"] == "done" and os.path.exists(chunk["path"])
+
+    def chunk_duration(self, idx, chunk_idx):
+        return self._chapter(idx)["chunks"][chunk_idx].get("duration")
+
+    def mark_chunk(self, idx, chunk_idx, ok, duration=None, failure=None):
+        with self._lock:
+            chapter = self._chapter(idx)
+            chapter["chunks"][chunk_idx]["status"] = "done" if ok else "failed"
+            chapter["chunks"][chunk_idx]["duration"] = duration if ok else None
+            # Engine error and attempts of a chunk that failed after its retries
+            chapter["chunks"][chunk_idx]["failure"] = None if ok else failure
+            if not ok:
+                # A failed chunk means the chapter has to be re-merged on resume
+                chapter["status"] = "pending"
+            self.save()
+
+    def summary(self):
+        """Counts of chapters and chunks per status"""
+        chapters = {}
+        chunks = {}
+        for entry in self.data["chapters"].values():
+            chapters[entry["status"]] = chapters.get(entry["status"], 0) + 1
+            for chunk in entry["chunks"] or []:
+                chunks[chunk["status"]] = chunks.get(chunk["status"], 0) + 1
+        return {"job_id": self.job_id, "status": self.data["status"],
+                "chapters": chapters, "chunks": chunks}
+
+class ConversionPipeline:
+    """Overlapped extract -> clean/split -> synthesize -> encode stages.
+
+    Every stage runs on its own worker threads and hands work to the next
+    one through a bounded queue, so network-bound synthesis and CPU-bound
+    encoding overlap while a slow stage applies backpressure instead of
+    letting the whole book pile up in memory. ``queue_depths()`` and
+    ``stage_stats()`` show which stage is the bottleneck. With a
+    ``JobManifest`` every chunk and chapter is checkpointed, and work that
+    the manifest already records as done is skipped.
+    """
+
+    def __init__(self, converter, tts_method="gTTS", voice_settings=None, use_voice_cloning=False,
+                 pdf_filename="audiobook", progress_callback=None, workers=None,
+                 queue_size=4, concurrency=None, manifest=None, selected=None, workspace=None, preview=None,
+                 partial_source=False):
+        self.converter = converter
+        self.manifest = manifest
+        # The source is only what was extracted before an interruption, so
+        # the job can't complete from it
+        self.partial_source = partial_source
+        # StreamingPreview that publishes chunks as they finish, in book order
+        self.preview = preview
+        # JobWorkspace for chunk/chapter files the manifest does not place
+        self.workspace = workspace
+        # Chapter indexes (see PDFToAudiobook.chapter_index) to read from a PDF source
+        self.selected = selected
+        self.tts_method = tts_method
+        self.voice_settings = voice_settings
+        self.use_voice_cloning = use_voice_cloning
+        self.pdf_filename = pdf_filename
+        self.progress_callback = progress_callback
+        self.concurrency = concurrency
+        self.workers = dict(DEFAULT_PIPELINE_WORKERS)
+        if workers:
+            self.workers.update(workers)
+        # Input queue of each stage after extraction
+        self.queues = {stage: queue.Queue(maxsize=max(1, queue_size))
+                       for stage in ("prepare", "synthesize", "encode")}
+        self._stats = {stage: {"items": 0, "busy_seconds": 0.0, "peak_queue": 0}
+                       for stage in DEFAULT_PIPELINE_WORKERS}
+        self._remaining = {}
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._errors = []
+        self._chunks_in_flight = 0
+        self._total = None
+        self._seen = 0
+        self._encoded = 0
+        self._results = {}
+        # One record per chunk that failed after its retries (chapter, chunk, error, ...)
+        self.failed_chunks = []
+        self.synthesizer = None
+
+    # -- monitoring -------------------------------------------------------
+
+    def queue_depths(self):
+        """Items waiting in front of each stage, plus chunks being synthesized"""
+        depths = {stage: q.qsize() for stage, q in self.queues.items()}
+        with self._lock:
+            depths["chunks_in_flight"] = self._chunks_in_flight
+        return depths
+
+    def stage_stats(self):
+        """Items handled, busy time and peak input queue depth per stage"""
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in self._stats.items()}
+
+    # -- plumbing ---------------------------------------------------------
+
+    def _put(self, stage, item):
+        q = self.queues[stage]
+        while True:
+            if self._abort.is_set():
+                raise _PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        with self._lock:
+            stats = self._stats[stage]
+            stats["peak_queue"] = max(stats["peak_queue"], q.qsize())
+
+    def _get(self, stage):
+        q = self.queues[stage]
+        while True:
+            if self._abort.is_set():
+                raise _PipelineAborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _record(self, stage, started):
+        with self._lock:
+            self._stats[stage]["items"] += 1
+            self._stats[stage]["busy_seconds"] += time.perf_counter() - started
+
+    def _finish_worker(self, stage, next_stage):
+        """Last worker out of a stage tells every worker of the next stage to stop"""
+        with self._lock:
+            self._remaining[stage] -= 1
+            last = self._remaining[stage] == 0
+        if last and next_stage:
+            for _ in range(self.workers[next_stage]):
+                self._put(next_stage, None)
+
+    def _run_worker(self, stage, next_stage, body):
         try:
-            source = AudioSegment.from_file(source_audio_path)
+            body()
+            self._finish_worker(stage, next_stage)
+        except _PipelineAborted:
+            pass
+        except Exception as e:
+            self._errors.append(e)
+            self._abort.set()
+
+    # -- stages -----------------------------------------------------------
+
+    @staticmethod
+    def _is_pdf(source):
+        return isinstance(source, (str, os.PathLike, bytes)) or hasattr(source, 'read')
+
+    def _extract(self, source):
+        if self._is_pdf(source):
+            chapters = self.converter.iter_chapters(source, selected=self.selected)
+        else:
+            chapters = iter(source)
+        idx = 0
+        while True:
+            started = time.perf_counter()
+            chapter = next(chapters, None)
+            if chapter is None:
+                break
+            self._record("extract", started)
+            self.converter.metrics.observe_stage("extract", time.perf_counter() - started)
+            if self.manifest is not None:
+                self.manifest.register_chapter(idx, chapter)
+            with self._lock:
+                self._seen += 1
+            self._put("prepare", (idx, chapter))
+            idx += 1
+
+    def _prepare(self):
+        while True:
+            item = self._get("prepare")
+            if item is None:
+                return
+            started = time.perf_counter()
+            idx, chapter = item
+            manifest = self.manifest
+            if manifest is not None and manifest.chapter_done(idx):
+                # Finished in an earlier run
+                audio_file = manifest.audio_file(idx)
+                if audio_file:
+                    with self._lock:
+                        self._results[idx] = audio_file
+                if self.preview is not None:
+                    self.preview.expect(idx, 0)
+                self._record("prepare", started)
+                continue
+            if manifest is not None and manifest.has_chunks(idx):
+                text_chunks = manifest.chunk_texts(idx)
+            else:
+                # Basic text cleaning
+                with self.converter.metrics.stage("clean"):
+                    clean_text = self.converter.clean_text_fast(chapter['content'])
+                if not clean_text.strip():
+                    if manifest is not None:
+                        manifest.mark_chapter(idx, status="empty")
+                    if self.preview is not None:
+                        self.preview.expect(idx, 0)
+                    self._record("prepare", started)
+                    continue
+                # Sentence-boundary chunks sized for the engine
+                with self.converter.metrics.stage("split"):
+                    text_chunks = self.converter.split_text_fast(clean_text, engine=self.synthesizer.engine)
+                if manifest is not None:
+                    manifest.set_chunks(idx, text_chunks)
+            self._record("prepare", started)
+            self._put("synthesize", (idx, chapter, text_chunks))
+
+    def _chunk_done(self, future):
+        with self._lock:
+            self._chunks_in_flight -= 1
+
+    def _synthesize(self):
+        while True:
+            item = self._get("synthesize")
+            if item is None:
+                return
+            started = time.perf_counter()
+            idx, chapter, text_chunks = item
+            chunk_paths = []
+            futures = []
+            preview = self.preview
+            if preview is not None:
+                preview.expect(idx, len(text_chunks), chapter['title'])
+            for chunk_idx, chunk in enumerate(text_chunks):
+                if self.manifest is not None:
+                    chunk_path = self.manifest.chunk_path(idx, chunk_idx)
+                    if self.manifest.chunk_done(idx, chunk_idx):
+                        # Synthesized before the job was interrupted
+                        self.synthesizer.record_duration(chunk_path, self.manifest.chunk_duration(idx, chunk_idx))
+                        if preview is not None:
+                            preview.stage(idx, chunk_idx, chunk_path, self.synthesizer.duration(chunk_path))
+                        chunk_paths.append(chunk_path)
+                        future = Future()
+                        future.set_result(True)
+                        futures.append(future)
+                        continue
+                elif self.workspace is not None:
+                    chunk_path = self.workspace.temp_path('.mp3', prefix='chunk_')
+                else:
+                    temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+                    temp_audio.close()
+                    chunk_path = temp_audio.name
+                chunk_paths.append(chunk_path)
+                with self._lock:
+                    self._chunks_in_flight += 1
+                on_ready = None
+                if preview is not None:
+                    on_ready = lambda path, idx=idx, chunk_idx=chunk_idx: preview.stage(
+                        idx, chunk_idx, path, self.synthesizer.duration(path)
+                    )
+                future = self.synthesizer.submit(chunk, chunk_path, on_ready)
+                future.add_done_callback(self._chunk_done)
+                if preview is not None:
+                    future.add_done_callback(
+                        lambda f, idx=idx, chunk_idx=chunk_idx: self.synthesizer.result(f) or preview.skip(idx, chunk_idx)
+                    )
+                if self.manifest is not None:
+                    future.add_done_callback(
+                        lambda f, idx=idx, chunk_idx=chunk_idx, path=chunk_path: self.manifest.mark_chunk(
+                            idx, chunk_idx, self.synthesizer.result(f), self.synthesizer.duration(path),
+                            self.synthesizer.failure(path)
+                        )
+                    )
+                futures.append(future)
+            self._record("synthesize", started)
+            # Blocks while the encoder is behind, which caps chunks in flight
+            self._put("encode", (idx, chapter, chunk_paths, futures))
+
+    def _encode(self):
+        while True:
+            item = self._get("encode")
+            if item is None:
+                return
+            idx, chapter, chunk_paths, futures = item
+            
+            # Collect chunks in their original order
+            chunk_files = []
+            failed = []
+            for chunk_idx, (path, future) in enumerate(zip(chunk_paths, futures)):
+                if self.synthesizer.result(future):
+                    chunk_files.append(path)
+                else:
+                    failed.append(dict(self.synthesizer.failure(path) or {"engine": self.synthesizer.engine},
+                                       chapter=idx, title=chapter['title'], chunk=chunk_idx))
+                    if os.path.exists(path):
+                        os.remove(path)
+            if failed:
+                with self._lock:
+                    self.failed_chunks.extend(failed)
+                self.converter.notify("warning", f"{chapter['title']}: {len(failed)} chunk(s) failed after "
+                                                 f"retries ({failed[0].get('error') or 'no audio'})")
             
-            if self.voice_characteristics:
-                # Only apply volume matching for speed
-                target_dBFS = self.voice_characteristics.get('dBFS', source.dBFS)
-                volume_change = target_dBFS - source.dBFS
-                source = source + volume_change
+            started = time.perf_counter()
+            with self._lock:
+                self._encoded += 1
+                done, total = self._encoded, self._total or self._seen
+            if self.progress_callback:
+                self.progress_callback(min(1.0, done / max(total, 1)), f"Processing {chapter['title']}...")
             
-            # Quick export without heavy processing
-            source.export(output_path, format='mp3', bitrate="192k")
-            return True
+            if self.manifest is not None and failed:
+                # Keep the good chunks on disk; resume() re-synthesizes the rest
+                self.manifest.mark_chapter(idx, status="failed")
+                self._record("encode", started)
+                continue
             
-        except Exception as e:
-            return False
+            if self.workspace is not None:
+                self.workspace.check_quota()
+            if self.manifest is not None:
+                output_path = self.manifest.chapter_path(idx)
+            elif self.workspace is not None:
+                output_path = self.workspace.temp_path('.mp3', prefix='chapter_')
+            else:
+                output_path = None
+            audio_file = self.converter._assemble_chapter(
+                chapter, chunk_files, self.use_voice_cloning, self.pdf_filename,
+                output_path=output_path,
+                chunk_durations=[self.synthesizer.duration(path) for path in chunk_files]
+            )
+            if self.manifest is not None:
+                self.manifest.mark_chapter(idx, audio_file)
+            self._record("encode", started)
+            if audio_file:
+                with self._lock:
+                    self._results[idx] = audio_file
+
+    # -- entry point ------------------------------------------------------
+
+    def run(self, source):
+        """Convert a list of chapters or a PDF (streamed via iter_chapters).
+
+        Returns the chapter audio files in book order.
+        """
+        if not self._is_pdf(source) and hasattr(source, '__len__'):
+            self._total = len(source)
+        elif self._is_pdf(source) and self.selected is not None:
+            self._total = len(self.selected)
+        stages = [
+            ("extract", "prepare", lambda: self._extract(source)),
+            ("prepare", "synthesize", self._prepare),
+            ("synthesize", "encode", self._synthesize),
+            ("encode", None, self._encode),
+        ]
+        with ChunkSynthesizer(self.converter, self.tts_method, self.voice_settings,
+                              self.concurrency) as synthesizer:
+            self.synthesizer = synthesizer
+            threads = []
+            for stage, next_stage, body in stages:
+                if stage == "extract":
+                    self.workers[stage] = 1  # a PDF is read front to back
+                self.workers[stage] = max(1, int(self.workers[stage]))
+                self._remaining[stage] = self.workers[stage]
+                for n in range(self.workers[stage]):
+                    thread = threading.Thread(
+                        target=self._run_worker, args=(stage, next_stage, body),
+                        name=f"pipeline-{stage}-{n}", daemon=True
+                    )
+                    _attach_streamlit_context(thread)
+                    threads.append(thread)
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        if self.manifest is not None:
+            if not self._errors and not self.partial_source:
+                self.manifest.data["extraction_complete"] = True
+            complete = not self._errors and self.manifest.data["extraction_complete"] and all(
+                self.manifest.chapter_done(idx) for idx in self.manifest.chapter_indexes()
+            )
+            self.manifest.set_status("completed" if complete else "failed")
+        
+        if self._errors:
+            raise self._errors[0]
+        return [self._results[idx] for idx in sorted(self._results)]
 
 class PDFToAudiobook:
-    def __init__(self):
+    def __init__(self, concurrency=None, cache_dir=None, cache_size_mb=2048, extract_workers=None,
+                 message_callback=None):
         self.tts_engine = None
-        self.voice_cloner = FastVoiceCloner()
+        # Receives (level, message) for user-facing notices; the Streamlit UI
+        # shows them as toasts, headless callers just get log records
+        self.message_callback = message_callback
+        self.voice_cloner = FastVoiceCloner(notify=self.notify)
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
-        
+        # Per-engine chunk concurrency, e.g. {"Edge": 16, "gTTS": 2}
+        self.concurrency = dict(DEFAULT_TTS_CONCURRENCY)
+        if concurrency:
+            self.concurrency.update(concurrency)
+        # Extra engines added with register_engine()
+        self.custom_engines = {}
+        # Online engine request limits and retry policy (see RequestScheduler), e.g.
+        # {"gTTS": {"rate": 2, "burst": 4, "retries": 6}}
+        self.rate_limits = {engine: dict(limit) for engine, limit in ONLINE_RATE_LIMITS.items()}
+        self._token_buckets = {}
+        self._bucket_lock = threading.Lock()
+        # Chunks that still failed after retries in the last job (see ChunkSynthesizer.failures)
+        self.last_failed_chunks = []
+        # Offline pyttsx3 worker processes, started on first use (see Pyttsx3WorkerPool)
+        self._pyttsx3_pool = None
+        self._pool_lock = threading.Lock()
+        self.pyttsx3_timeout = 120.0
+        # Per-engine chunk sizes for the sentence chunker (see TextChunker)
+        self.chunk_profiles = {engine: dict(profile) for engine, profile in CHUNK_PROFILES.items()}
+        # PDF extraction: "auto" (PyMuPDF when installed), "pymupdf" or "pypdf2"
+        self.extraction_backend = "auto"
+        self.extract_workers = extract_workers or os.cpu_count() or 1
+        self.extract_shard_pages = 32          # pages per worker task
+        self.parallel_extract_min_pages = 64   # smaller PDFs are read in-process
+        # OCR fallback for image-only / low-text pages (needs PyMuPDF + Tesseract)
+        self.ocr_enabled = True
+        self.ocr_dpi = 300
+        self.ocr_lang = "eng"
+        self.ocr_min_chars = 25
+        self.ocr_workers = os.cpu_count() or 1
+        self.ocr_cache = OCRPageCache(os.path.join(cache_dir, "ocr") if cache_dir else None)
+        # Strip running headers/footers and page numbers before synthesis
+        self.strip_boilerplate = True
+        self.last_boilerplate_stats = None
+        # Chapter titles + page ranges per PDF (from the outline, else a heading scan)
+        self.chapter_index_cache = ChapterIndexCache(os.path.join(cache_dir, "index") if cache_dir else None)
+        self.last_pipeline = None
+        # Checkpointed jobs (manifest + chunk audio) that resume() can pick up
+        self.checkpoint_jobs = True
+        self.jobs_dir = os.path.join(cache_dir or DEFAULT_CACHE_DIR, "jobs")
+        # Every job's scratch files live in jobs_dir/<job_id> (see Workspace)
+        self.workspace_quota_mb = None
+        self.workspace_max_age_hours = 72
+        self.last_job_id = None
+        # Frame-level MP3 merging; set audio_merger.mode = "decode" for the pydub path,
+        # or audio_merger.memory_budget_mb to cap assembly memory for very long books
+        self.audio_merger = StreamingAudioMerger()
+        self.last_merge_stats = None
+        # Where the last complete book was published in script_dir
+        self.last_export_path = None
+        # StreamingPreview of the last streamed job (lives in its job directory while it runs)
+        self.last_preview = None
+        # Persistent chunk cache shared by every job (cache_size_mb=0 disables it)
+        self.chunk_cache = None
+        if cache_size_mb:
+            self.chunk_cache = TTSChunkCache(os.path.join(cache_dir, "tts") if cache_dir else None,
+                                             max_bytes=int(cache_size_mb * 1024 * 1024))
+        # Stage timers, TTS latency histograms, failure counts (see ConversionMetrics)
+        self.metrics = ConversionMetrics(self.chunk_cache)
+
+    def register_engine(self, name, synthesize, concurrency=4, chunk_profile=None, rate_limit=None):
+        """Add a blocking TTS engine usable as tts_method=name.
+
+        ``synthesize(text, output_path, voice_settings)`` must write the
+        chunk audio to output_path and return True on success.
+        ``chunk_profile`` sets its chunk sizes (see CHUNK_PROFILES); an online
+        engine should pass ``rate_limit`` (see ONLINE_RATE_LIMITS) and raise
+        on failure, so it is throttled and retried like Edge and gTTS.
+        """
+        self.custom_engines[name] = synthesize
+        self.concurrency[name] = concurrency
+        self.chunk_profiles[name] = dict(chunk_profile or DEFAULT_CHUNK_PROFILE)
+        if rate_limit:
+            self.rate_limits[name] = dict(rate_limit)
+        else:
+            self.rate_limits.pop(name, None)
+    
+    def token_bucket(self, engine):
+        """The engine's request rate limiter, shared by every job on this converter"""
+        limit = self.rate_limits.get(engine)
+        if not limit or not limit.get("rate"):
+            return None
+        key = (engine, limit["rate"], limit.get("burst"))
+        with self._bucket_lock:
+            if key not in self._token_buckets:
+                self._token_buckets[key] = TokenBucket(limit["rate"], limit.get("burst"))
+            return self._token_buckets[key]
+    
+    def pyttsx3_pool(self, workers):
+        """The long-lived pyttsx3 worker pool, resized to `workers` processes if needed"""
+        with self._pool_lock:
+            pool = self._pyttsx3_pool
+            if pool is not None and pool.size == workers and not pool.init_error:
+                return pool
+            self._pyttsx3_pool = Pyttsx3WorkerPool(workers, timeout=self.pyttsx3_timeout, metrics=self.metrics)
+        if pool is not None:
+            pool.close()
+        return self._pyttsx3_pool
+    
+    def close(self):
+        """Stop background worker processes (the pyttsx3 pool)"""
+        with self._pool_lock:
+            pool, self._pyttsx3_pool = self._pyttsx3_pool, None
+        if pool is not None:
+            pool.close()
+    
+    def notify(self, level, message):
+        """Report a user-facing message ("success", "info", "warning" or "error")"""
+        _log_message(level, message)
+        if self.message_callback:
+            self.message_callback(level, message)
+    
     def extract_text_from_pdf(self, pdf_file):
-        """Fast PDF text extraction - skip OCR by default"""
+        """Fast PDF text extraction - OCR only for pages without a text layer"""
         chapters = []
-        current_chapter = {"title": "Chapter 1", "content": ""}
-        chapter_num = 1
         
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            with self.metrics.stage("extract"):
+                for chapter in self.iter_chapters(pdf_file):
+                    chapters.append(chapter)
+        except Exception as e:
+            self.notify("error", f"Error extracting PDF: {str(e)}")
+        
+        return chapters if chapters else [{"title": "Full Book", "content": ""}]
+    
+    def chapter_index(self, pdf_file):
+        """Chapters as titles and page ranges, without keeping any text.
+
+        Built from the PDF outline when it has one, otherwise from a scan
+        for "Chapter N" headings, and cached per PDF hash either way. Each
+        entry is {"index", "title", "start", "stop"} (0-based pages, stop
+        exclusive); pass the indexes of the wanted chapters to
+        iter_chapters() or process_chapters_fast().
+        """
+        source = _pdf_source(pdf_file)
+        pdf_hash = _pdf_digest(source)
+        index = self._cached_index(pdf_hash) or self._outline_index(source)
+        if index is None:
+            index = {"source": "headings", "chapters": [entry for entry, _ in self._scan_chapters(source)],
+                     "ocr": self._ocr_active()}
+        self.chapter_index_cache.put(pdf_hash, index)
+        return [dict(entry, index=idx) for idx, entry in enumerate(index["chapters"])]
+    
+    def _ocr_active(self):
+        return self.ocr_enabled and ocr_available()
+    
+    def _cached_index(self, pdf_hash):
+        """Cached index, unless it is a heading scan done without OCR that OCR could now improve"""
+        index = self.chapter_index_cache.get(pdf_hash)
+        if index and index["source"] == "headings" and not index.get("ocr") and self._ocr_active():
+            return None
+        return index
+    
+    def _outline_index(self, source):
+        try:
+            page_count, entries = _read_outline(source)
+        except Exception as e:
+            logger.info("No usable PDF outline: %s", e)
+            return None
+        chapters = _outline_chapters(entries, page_count)
+        if not chapters:
+            return None
+        return {"source": "outline", "chapters": chapters}
+    
+    def iter_chapters(self, pdf_file, selected=None):
+        """Yield chapters in book order, extracting only the pages needed.
+
+        With an outline or a cached index, each chapter's page range is
+        extracted on demand, so with ``selected`` (indexes into
+        chapter_index()) the other chapters are never read. Otherwise the
+        book is scanned once: chapters are yielded as soon as their last
+        page has been extracted and the index is cached for next time.
+        """
+        selected = set(selected) if selected is not None else None
+        source = _pdf_source(pdf_file)
+        pdf_hash = _pdf_digest(source)
+        index = self._cached_index(pdf_hash)
+        if index is None:
+            index = self._outline_index(source)
+            if index is not None:
+                self.chapter_index_cache.put(pdf_hash, index)
+        
+        spill_path = None
+        if not isinstance(source, str):
+            # Read pages from one file instead of re-spilling the upload per chapter
+            spill = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+            spill.write(source)
+            spill.close()
+            source = spill_path = spill.name
+        try:
+            yield from self._iter_indexed_chapters(source, pdf_hash, index, selected)
+        finally:
+            if spill_path:
+                os.remove(spill_path)
+    
+    def _iter_indexed_chapters(self, source, pdf_hash, index, selected):
+        """iter_chapters body once the source is a path; strips boilerplate per chapter"""
+        boilerplate = BoilerplateFilter()
+        if self.strip_boilerplate:
+            try:
+                boilerplate.prime(self._sample_page_texts(source))
+            except Exception as e:
+                logger.info("Could not sample pages for boilerplate detection: %s", e)
+        self.last_boilerplate_stats = boilerplate.stats()
+        
+        def chapter_text(pages):
+            if self.strip_boilerplate:
+                pages, chars_removed, lines_removed = boilerplate.strip_pages(pages)
+                self.metrics.inc("boilerplate_chars_removed", chars_removed)
+                self.metrics.inc("boilerplate_lines_removed", lines_removed)
+                self.last_boilerplate_stats = boilerplate.stats()
+            return "".join(text + "\n" for text in pages)
+        
+        if index is None:
+            entries = []
+            for idx, (entry, pages) in enumerate(self._scan_chapters(source)):
+                entries.append(entry)
+                if selected is None or idx in selected:
+                    yield {"title": entry["title"], "content": chapter_text(pages)}
+            self.chapter_index_cache.put(pdf_hash, {"source": "headings", "chapters": entries,
+                                                    "ocr": self._ocr_active()})
+            return
+        
+        for idx, entry in enumerate(index["chapters"]):
+            if selected is not None and idx not in selected:
+                continue
+            content = chapter_text(list(self.iter_page_texts(source, entry["start"], entry["stop"])))
+            if content.strip():
+                yield {"title": entry["title"], "content": content}
+    
+    def _sample_page_texts(self, source, count=12):
+        """Text layer of up to count pages spread evenly over the book (no OCR)"""
+        if FITZ_AVAILABLE and self.extraction_backend in ("auto", "pymupdf"):
+            doc = _open_pdf(source)
+            try:
+                page_count = doc.page_count
+                return [doc[page_num].get_text("text") for page_num in _spread_pages(page_count, count)]
+            finally:
+                doc.close()
+        import PyPDF2
+        reader = PyPDF2.PdfReader(source)
+        return [reader.pages[page_num].extract_text() or ""
+                for page_num in _spread_pages(len(reader.pages), count)]
+    
+    def _scan_chapters(self, source):
+        """Heading-scan fallback: yield (index entry, page texts) per chapter"""
+        chapter_num = 1
+        chapter_start = 0
+        title = None
+        pages = []
+        has_content = False
+        page_num = -1
+        
+        for page_num, text in enumerate(self.iter_page_texts(source)):
+            # Simple chapter detection
+            match = CHAPTER_HEADING_RE.search(text)
+            if has_content and match:
+                entry = {"title": title or f"Chapter {chapter_num}", "start": chapter_start, "stop": page_num}
+                yield entry, pages
+                chapter_num += 1
+                chapter_start = page_num
+                title = None
+                pages = []
+                has_content = False
+            if match and title is None and not has_content:
+                title = _heading_title(text, match)
             
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text = page.extract_text()
-                
-                # Simple chapter detection
-                if re.search(r'Chapter\s+\d+|CHAPTER\s+\d+', text, re.IGNORECASE):
-                    if current_chapter["content"].strip():
-                        chapters.append(current_chapter)
-                        chapter_num += 1
-                        current_chapter = {
-                            "title": f"Chapter {chapter_num}",
-                            "content": ""
-                        }
-                
-                current_chapter["content"] += text + "\n"
+            pages.append(text)
+            has_content = has_content or bool(text.strip())
+        
+        if has_content:
+            entry = {"title": title or f"Chapter {chapter_num}", "start": chapter_start, "stop": page_num + 1}
+            yield entry, pages
+    
+    def iter_page_texts(self, pdf_file, start=0, stop=None):
+        """Yield the text of pages [start, stop) in order (every page by default).
+
+        Uses PyMuPDF when available - sharded across a process pool for large
+        PDFs - and falls back to PyPDF2 otherwise. With PyMuPDF, scanned
+        pages are OCR'd in a separate process pool while text pages keep the
+        fast path.
+        """
+        use_pymupdf = FITZ_AVAILABLE and self.extraction_backend in ("auto", "pymupdf")
+        source = _pdf_source(pdf_file)
+        
+        page_count = None
+        if use_pymupdf:
+            try:
+                doc = _open_pdf(source)
+                page_count = doc.page_count
+                doc.close()
+            except Exception:
+                if self.extraction_backend == "pymupdf":
+                    raise
+        
+        if page_count is None:
+            # PyPDF2 fallback
+            import PyPDF2
+            pdf_reader = PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+            for page in pdf_reader.pages[start:stop]:
+                yield page.extract_text() or ""
+            return
+        
+        stop = page_count if stop is None else min(stop, page_count)
+        use_ocr = self._ocr_active()
+        parallel = stop - start >= self.parallel_extract_min_pages and self.extract_workers > 1
+        spill_path = None
+        if not isinstance(source, str) and (parallel or use_ocr):
+            # Hand workers a path instead of pickling the whole PDF per task
+            spill = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+            spill.write(source)
+            spill.close()
+            source = spill_path = spill.name
+        
+        try:
+            ocr_min_chars = self.ocr_min_chars if use_ocr else 0
+            if parallel:
+                records = self._iter_page_records_parallel(source, start, stop, ocr_min_chars)
+            else:
+                records = iter(_extract_page_range(source, start, stop, ocr_min_chars))
             
-            if current_chapter["content"].strip():
-                chapters.append(current_chapter)
+            if use_ocr:
+                yield from self._iter_with_ocr(source, records)
+            else:
+                for _, text, _ in records:
+                    yield text
+        finally:
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+    
+    def _iter_page_records_parallel(self, source, first, last, ocr_min_chars=0):
+        """Shard pages [first, last) across a process pool, yielding pages in order"""
+        shard = max(1, self.extract_shard_pages)
+        ranges = deque((start, min(start + shard, last)) for start in range(first, last, shard))
+        pool = ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=_worker_context())
+        try:
+            # Keep a bounded window in flight so memory doesn't grow with the book
+            in_flight = deque()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < self.extract_workers * 2:
+                    start, stop = ranges.popleft()
+                    in_flight.append(pool.submit(_extract_page_range, source, start, stop, ocr_min_chars))
+                yield from in_flight.popleft().result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def _iter_with_ocr(self, source, records):
+        """Replace flagged pages with (cached or freshly computed) OCR text, in page order"""
+        pdf_hash = _pdf_digest(source)
+        dpi, lang = self.ocr_dpi, self.ocr_lang
+        window = max(1, self.ocr_workers) * 4
+        pending = deque()  # (page_num, text, future or None)
+        pool = None
         
-        except Exception as e:
-            st.error(f"Error extracting PDF: {str(e)}")
+        def resolve(entry):
+            page_num, text, future = entry
+            if future is None:
+                return text
+            try:
+                ocr_text = future.result()
+            except Exception:
+                return text
+            # Cached even when the text layer wins, so the page isn't OCR'd again
+            self.ocr_cache.put(pdf_hash, page_num, dpi, lang, ocr_text)
+            return _longer_text(text, ocr_text)
         
-        return chapters if chapters else [{"title": "Full Book", "content": current_chapter["content"]}]
+        try:
+            for page_num, text, needs_ocr in records:
+                future = None
+                if needs_ocr:
+                    cached = self.ocr_cache.get(pdf_hash, page_num, dpi, lang)
+                    self.metrics.inc("ocr_pages", result="cached" if cached is not None else "ocr")
+                    if cached is not None:
+                        text = _longer_text(text, cached)
+                    else:
+                        if pool is None:
+                            pool = ProcessPoolExecutor(max_workers=max(1, self.ocr_workers),
+                                                       mp_context=_worker_context())
+                        future = pool.submit(_ocr_page, source, page_num, dpi, lang)
+                pending.append((page_num, text, future))
+                
+                # Emit the finished prefix; block only when too many pages are waiting on OCR
+                while pending and (pending[0][2] is None or pending[0][2].done() or len(pending) > window):
+                    yield resolve(pending.popleft())
+            
+            while pending:
+                yield resolve(pending.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+    
+    async def _edge_tts_save(self, text, output_path, voice="en-US-AriaNeural"):
+        """One Edge TTS request; raises on failure (see RequestScheduler)"""
+        import edge_tts
+        communicate = edge_tts.Communicate(text, voice)
+        await communicate.save(output_path)
+        return True
     
     async def generate_with_edge_tts_fast(self, text, output_path, voice="en-US-AriaNeural"):
         """Fast Edge TTS generation"""
         try:
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(output_path)
-            return True
+            return await self._edge_tts_save(text, output_path, voice)
         except Exception as e:
+            logger.warning("Edge TTS chunk failed: %s", e)
             return False
     
+    def _gtts_save(self, text, output_path, lang='en'):
+        """One gTTS request; raises on failure (see RequestScheduler)"""
+        from gtts import gTTS
+        tts = gTTS(text=text, lang=lang, slow=False)
+        tts.save(output_path)
+        return True
+    
     def generate_with_gtts_fast(self, text, output_path, lang='en'):
         """Fast gTTS generation"""
         try:
-            tts = gTTS(text=text, lang=lang, slow=False)
-            tts.save(output_path)
-            return True
+            return self._gtts_save(text, output_path, lang)
         except Exception as e:
+            logger.warning("gTTS chunk failed: %s", e)
             return False
     
     def generate_with_pyttsx3_fast(self, text, output_path, voice_settings=None):
         """Fast pyttsx3 generation"""
         try:
             if self.tts_engine is None:
+                import pyttsx3
                 self.tts_engine = pyttsx3.init()
             
             # Use faster rate
@@ -152,168 +3564,375 @@ class PDFToAudiobook:
             self.tts_engine.runAndWait()
             return True
         except Exception as e:
+            logger.warning("pyttsx3 chunk failed: %s", e)
             return False
     
     def process_chapters_fast(self, chapters, voice_sample_path, tts_method="gTTS", 
-                             voice_settings=None, progress_callback=None, pdf_filename="audiobook"):
-        """Fast chapter processing with minimal voice processing"""
-        audio_files = []
-        total_chapters = len(chapters)
+                             voice_settings=None, progress_callback=None, pdf_filename="audiobook",
+                             concurrency=None, pipeline_workers=None, job_id=None, selected_chapters=None,
+                             stream=False, preview_callback=None):
+        """Fast chapter processing with minimal voice processing.
+
+        ``chapters`` may be a list of chapter dicts or a PDF, in which case
+        synthesis starts while later chapters are still being extracted and
+        ``selected_chapters`` (indexes into chapter_index()) limits which
+        chapters are extracted at all.
+        Progress is checkpointed under ``jobs_dir`` so ``resume()`` can
+        finish an interrupted job. With ``stream`` (or a ``preview_callback``)
+        every chunk is published to an HLS-style playlist as soon as it and
+        the chunks before it are synthesized (see StreamingPreview and
+        ``last_preview``), and ``preview_callback(segment)`` is called for each.
+        """
+        job_id = job_id or _new_job_id()
+        workspace = self.workspace().job(job_id)
+        manifest = None
+        if self.checkpoint_jobs:
+            settings = {
+                "tts_method": tts_method,
+                "voice_settings": voice_settings or {},
+                "pdf_filename": pdf_filename,
+                "voice_sample_path": voice_sample_path,
+                "concurrency": concurrency,
+                "pipeline_workers": pipeline_workers,
+                "pdf_path": os.fspath(chapters) if isinstance(chapters, (str, os.PathLike)) else None,
+                "selected_chapters": sorted(selected_chapters) if selected_chapters is not None else None,
+            }
+            manifest = JobManifest.create(self.jobs_dir, settings, job_id)
+            self.last_job_id = manifest.job_id
+            if ConversionPipeline._is_pdf(chapters) and settings["pdf_path"] is None:
+                # Keep uploads in the job so resume() can finish extracting them
+                pdf_path = os.path.join(manifest.job_dir, "source.pdf")
+                tmp_path = workspace.temp_path(".pdf")
+                with open(tmp_path, "wb") as f:
+                    f.write(_pdf_source(chapters))
+                os.replace(tmp_path, pdf_path)
+                settings["pdf_path"] = chapters = pdf_path
+                manifest.save(force=True)
         
+        return self._run_pipeline(chapters, manifest, voice_sample_path, tts_method, voice_settings,
+                                  progress_callback, pdf_filename, concurrency, pipeline_workers,
+                                  selected_chapters, workspace, stream or preview_callback is not None,
+                                  preview_callback)
+    
+    def resume(self, job_id, progress_callback=None, preview_callback=None):
+        """Finish a checkpointed job: only missing or failed chunks are synthesized
+        and only chapters that aren't done yet are merged again"""
+        manifest = JobManifest.load(self.jobs_dir, job_id)
+        workspace = self.workspace().job(job_id)
+        settings = manifest.settings
+        self.last_job_id = job_id
+        manifest.set_status("running")
+        
+        partial_source = False
+        if not manifest.data["extraction_complete"] and settings.get("pdf_path") \
+                and os.path.exists(settings["pdf_path"]):
+            # Extraction itself was interrupted - stream the PDF again
+            source = settings["pdf_path"]
+        else:
+            source = [manifest.load_chapter(idx) for idx in manifest.chapter_indexes()]
+            if not manifest.data["extraction_complete"]:
+                # Finish what was extracted, but the rest of the book is missing
+                partial_source = True
+                self.notify("warning", f"Source PDF of job {job_id} is gone; only the "
+                                       f"{len(source)} chapter(s) extracted before the interruption are resumed")
+        
+        voice_sample_path = settings.get("voice_sample_path")
+        if voice_sample_path and not os.path.exists(voice_sample_path):
+            voice_sample_path = None
+        
+        return self._run_pipeline(source, manifest, voice_sample_path, settings["tts_method"],
+                                  settings["voice_settings"], progress_callback, settings["pdf_filename"],
+                                  settings.get("concurrency"), settings.get("pipeline_workers"),
+                                  settings.get("selected_chapters"), workspace, preview_callback is not None,
+                                  preview_callback, partial_source)
+    
+    def workspace(self):
+        """The managed scratch space for jobs (quota and age eviction)"""
+        return Workspace(self.jobs_dir, self.workspace_quota_mb, self.workspace_max_age_hours)
+    
+    def save_upload(self, data, suffix=""):
+        """Store uploaded bytes (e.g. a voice sample) once in the workspace; returns the path"""
+        uploads = self.workspace().job("uploads", active=False)
+        path = os.path.join(uploads.path, hashlib.sha1(data).hexdigest()[:16] + suffix)
+        if not os.path.exists(path):
+            tmp_path = uploads.temp_path(suffix)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        else:
+            os.utime(path)  # still in use: keep it from age eviction
+        return path
+    
+    def list_jobs(self):
+        """Summaries of checkpointed jobs, newest first"""
+        jobs = []
+        if not os.path.isdir(self.jobs_dir):
+            return jobs
+        # Jobs the next job started would evict can't be resumed reliably
+        evictable = self.workspace().evictable()
+        for job_id in sorted(os.listdir(self.jobs_dir), reverse=True):
+            if os.path.join(self.jobs_dir, job_id) in evictable:
+                continue
+            try:
+                jobs.append(JobManifest.load(self.jobs_dir, job_id).summary())
+            except (OSError, ValueError, KeyError):
+                continue
+        return jobs
+    
+    def _run_pipeline(self, source, manifest, voice_sample_path, tts_method, voice_settings,
+                      progress_callback, pdf_filename, concurrency, pipeline_workers, selected_chapters=None,
+                      workspace=None, stream=False, preview_callback=None, partial_source=False):
         # Quick voice analysis if provided
         use_voice_cloning = False
         if voice_sample_path:
             use_voice_cloning = self.voice_cloner.analyze_voice_sample(voice_sample_path)
         
-        for idx, chapter in enumerate(chapters):
-            if progress_callback:
-                progress_callback((idx + 1) / total_chapters, f"Processing {chapter['title']}...")
-            
-            # Basic text cleaning
-            clean_text = self.clean_text_fast(chapter['content'])
-            
-            if not clean_text.strip():
-                continue
-            
-            # Process smaller chunks for memory efficiency
-            max_chunk_size = 5000  # Increased chunk size for speed
-            text_chunks = self.split_text_fast(clean_text, max_chunk_size)
-            
-            # Generate audio for each chunk
-            chunk_files = []
-            for chunk_idx, chunk in enumerate(text_chunks):
-                temp_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-                temp_audio.close()
-                
-                success = False
-                
-                # Generate TTS
-                if tts_method == "Edge TTS" and EDGE_TTS_AVAILABLE:
-                    voice = voice_settings.get('edge_voice', 'en-US-AriaNeural') if voice_settings else 'en-US-AriaNeural'
-                    success = asyncio.run(self.generate_with_edge_tts_fast(chunk, temp_audio.name, voice))
-                elif tts_method == "gTTS":
-                    lang = voice_settings.get('language', 'en') if voice_settings else 'en'
-                    success = self.generate_with_gtts_fast(chunk, temp_audio.name, lang)
-                else:
-                    success = self.generate_with_pyttsx3_fast(chunk, temp_audio.name, voice_settings)
-                
-                if success:
-                    chunk_files.append(temp_audio.name)
-            
-            # Quick merge without complex processing
-            if chunk_files:
-                chapter_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-                chapter_audio.close()
-                
-                if len(chunk_files) == 1:
-                    # Single chunk - just copy
-                    import shutil
-                    shutil.copy(chunk_files[0], chapter_audio.name)
-                    os.remove(chunk_files[0])
+        preview = None
+        if stream and workspace is not None:
+            preview = StreamingPreview(os.path.join(workspace.path, "preview"), preview_callback, self.metrics)
+        self.last_preview = preview
+        
+        pipeline = ConversionPipeline(
+            self, tts_method, voice_settings,
+            use_voice_cloning=use_voice_cloning,
+            pdf_filename=pdf_filename,
+            progress_callback=progress_callback,
+            workers=pipeline_workers,
+            concurrency=concurrency,
+            manifest=manifest,
+            selected=selected_chapters,
+            workspace=workspace,
+            preview=preview,
+            partial_source=partial_source,
+        )
+        self.last_pipeline = pipeline
+        audio_files = None
+        try:
+            audio_files = pipeline.run(source)
+            return audio_files
+        except BaseException:
+            if manifest is not None:
+                manifest.flush()
+                manifest.set_status("failed")
+            raise
+        finally:
+            self.last_failed_chunks = sorted(pipeline.failed_chunks, key=lambda r: (r["chapter"], r["chunk"]))
+            if preview is not None:
+                preview.finish()
+            if workspace is not None:
+                if manifest is None or manifest.data["status"] == "completed":
+                    # Chapters are already published to script_dir; drop the job's scratch copies
+                    for audio_file in audio_files or []:
+                        audio_file['path'] = audio_file['saved_path']
+                    workspace.cleanup()
                 else:
-                    # Multiple chunks - simple concatenation
-                    combined = AudioSegment.empty()
-                    for chunk_file in chunk_files:
-                        chunk_audio_seg = AudioSegment.from_file(chunk_file)
-                        combined += chunk_audio_seg
-                        os.remove(chunk_file)
-                    combined.export(chapter_audio.name, format='mp3', bitrate="192k")
-                
-                # Optional: Apply basic voice matching
-                if use_voice_cloning:
-                    cloned_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-                    cloned_audio.close()
-                    
-                    if self.voice_cloner.apply_basic_voice_transfer(chapter_audio.name, cloned_audio.name):
-                        os.remove(chapter_audio.name)
-                        chapter_audio.name = cloned_audio.name
-                
-                # Save to directory
-                safe_chapter_title = re.sub(r'[^\w\s-]', '', chapter['title']).strip().replace(' ', '_')
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                saved_filename = f"{pdf_filename}_{safe_chapter_title}_{timestamp}.mp3"
-                saved_path = os.path.join(self.script_dir, saved_filename)
-                
-                # Copy to saved location
-                import shutil
-                shutil.copy(chapter_audio.name, saved_path)
-                
-                audio_files.append({
-                    'title': chapter['title'],
-                    'path': chapter_audio.name,
-                    'saved_path': saved_path
-                })
-                st.success(f"✅ Generated: {saved_filename}")
+                    # Keep checkpointed work for resume(); stale jobs are evicted by age
+                    workspace.release()
+    
+    def _assemble_chapter(self, chapter, chunk_files, use_voice_cloning, pdf_filename, output_path=None,
+                          chunk_durations=None):
+        """Merge a chapter's chunk files, apply voice matching and save a copy"""
+        if not chunk_files:
+            return None
+        
+        # Chapter length from the durations recorded at synthesis time
+        duration = None
+        if chunk_durations and None not in chunk_durations:
+            duration = sum(chunk_durations)
+        
+        # Quick merge without complex processing
+        chapter_path = output_path
+        if chapter_path is None:
+            chapter_audio = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+            chapter_audio.close()
+            chapter_path = chapter_audio.name
+        
+        # Voice matching: measure the chunks block by block, then apply the
+        # gain while the chapter file is written (no separate re-encode)
+        gain_db = 0.0
+        if use_voice_cloning:
+            with self.metrics.stage("voice_match"):
+                gain_db = self.voice_cloner.gain_db(chunk_files)
+        
+        if len(chunk_files) == 1 and not gain_db:
+            # Single chunk - just move it
+            os.replace(chunk_files[0], chapter_path)
+        else:
+            # Frame-level concatenation (gain in the frame headers), no decode
+            merge_stats = {}
+            try:
+                with self.metrics.stage("merge"):
+                    merged = self.audio_merger.merge(chunk_files, chapter_path, gain_db=gain_db,
+                                                     stats=merge_stats)
+            finally:
+                for chunk_file in chunk_files:
+                    os.remove(chunk_file)
+            self._record_merge(merge_stats, scope="chapter")
+            if not merged:
+                if os.path.exists(chapter_path):
+                    os.remove(chapter_path)
+                return None
+        
+        # Save to directory
+        safe_chapter_title = re.sub(r'[^\w\s-]', '', chapter['title']).strip().replace(' ', '_')
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        saved_filename = f"{pdf_filename}_{safe_chapter_title}_{timestamp}.mp3"
+        saved_path = os.path.join(self.script_dir, saved_filename)
+        
+        # Link (or copy) to saved location instead of writing the audio twice
+        with self.metrics.stage("export"):
+            _link_or_copy(chapter_path, saved_path)
+        self.metrics.inc("chapters_exported")
         
-        return audio_files
+        self.notify("success", f"✅ Generated: {saved_filename}")
+        return {
+            'title': chapter['title'],
+            'path': chapter_path,
+            'saved_path': saved_path,
+            'duration': duration,
+        }
     
+    def _record_merge(self, merge_stats, scope):
+        """Report a merge's peak memory and warn when it broke the budget"""
+        if not merge_stats:
+            return
+        self.metrics.observe_max("merge_peak_rss_bytes", merge_stats["peak_rss_bytes"], scope=scope)
+        if merge_stats["peak_helper_rss_bytes"]:
+            self.metrics.observe_max("merge_peak_helper_rss_bytes", merge_stats["peak_helper_rss_bytes"], scope=scope)
+        if merge_stats["within_budget"] is False:
+            peak_mb = (merge_stats["peak_rss_bytes"] + merge_stats["peak_helper_rss_bytes"]) / 2 ** 20
+            self.notify("warning", f"Audio assembly peaked at {peak_mb:.0f} MB, over the "
+                                   f"{self.audio_merger.memory_budget_mb} MB memory budget")
+
     def clean_text_fast(self, text):
-        """Fast text cleaning"""
+        """Fast text cleaning (paragraph breaks are kept for the chunker)"""
         # Basic cleaning only
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'[^\w\s\.\,\!\?\-\']', '', text)
+        text = '\n\n'.join(' '.join(paragraph.split()) for paragraph in PARAGRAPH_BREAK_RE.split(text)
+                             if paragraph.strip())
+        text = re.sub(r'[^\w\s\.\,\;\:\!\?\-\']', '', text)
         return text.strip()
     
-    def split_text_fast(self, text, max_chars=5000):
+    def chunk_text(self, text, engine=None, max_chars=None):
+        """Split text on sentence boundaries sized for the engine; returns (chunks, stats)"""
+        engine = engine or "default"
+        chunker = TextChunker.for_engine(engine, self.chunk_profiles, max_chars)
+        chunks, stats = chunker.split(text)
+        self.metrics.inc("text_chunks", stats["chunks"], engine=engine)
+        self.metrics.inc("text_chunk_chars", stats["chars"], engine=engine)
+        for kind, count in stats["boundaries"].items():
+            self.metrics.inc("chunk_boundaries", count, engine=engine, kind=kind)
+        self.metrics.observe_max("chunk_max_chars", stats["max_chars"], engine=engine)
+        return chunks, stats
+    
+    def split_text_fast(self, text, max_chars=None, engine=None):
         """Fast text splitting"""
-        if len(text) <= max_chars:
-            return [text]
-        
-        chunks = []
-        words = text.split()
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            word_length = len(word) + 1
-            if current_length + word_length > max_chars:
-                chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_length = word_length
-            else:
-                current_chunk.append(word)
-                current_length += word_length
-        
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
-        
-        return chunks
+        return self.chunk_text(text, engine, max_chars)[0]
     
     def merge_audio_files_fast(self, audio_files, output_path, pdf_filename="audiobook"):
-        """Fast audio merging"""
+        """Fast audio merging - streams frames, encodes at most once, writes once"""
         try:
-            combined = AudioSegment.empty()
-            
+            input_paths = []
             for audio_file in audio_files:
-                try:
-                    audio = AudioSegment.from_file(audio_file['path'])
-                    # Add small silence between chapters
-                    if len(combined) > 0:
-                        silence = AudioSegment.silent(duration=1000)
-                        combined = combined + silence + audio
-                    else:
-                        combined = audio
-                except Exception as e:
-                    st.warning(f"Could not add {audio_file['title']}: {str(e)}")
+                if os.path.exists(audio_file['path']):
+                    input_paths.append(audio_file['path'])
+                else:
+                    self.notify("warning", f"Could not add {audio_file['title']}: file is missing")
             
-            if len(combined) > 0:
-                # Export with reasonable quality
-                combined.export(output_path, format="mp3", bitrate="192k")
-                
+            # Small silence between chapters
+            merge_stats = {}
+            with self.metrics.stage("merge", scope="book"):
+                merged = input_paths and self.audio_merger.merge(input_paths, output_path, gap_ms=1000,
+                                                                 stats=merge_stats)
+            self.last_merge_stats = merge_stats or None
+            self._record_merge(merge_stats, scope="book")
+            if merged:
                 # Save to directory
                 timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
                 saved_filename = f"{pdf_filename}_complete_{timestamp}.mp3"
                 saved_path = os.path.join(self.script_dir, saved_filename)
-                combined.export(saved_path, format="mp3", bitrate="192k")
-                st.success(f"✅ Complete audiobook saved: {saved_filename}")
+                with self.metrics.stage("export", scope="book"):
+                    _link_or_copy(output_path, saved_path)
+                self.last_export_path = saved_path
+                self.notify("success", f"✅ Complete audiobook saved: {saved_filename}")
                 
                 return True
             return False
         except Exception as e:
-            st.error(f"Error merging: {str(e)}")
+            self.notify("error", f"Error merging: {str(e)}")
+            return False
+
+    def export_audiobook(self, audio_files, output_path, pdf_filename="audiobook", book_format="m4b", gap_ms=1000):
+        """Encode chapters once into a single M4B or Ogg/Opus book with chapter markers.
+
+        Markers come from the durations recorded at synthesis time; the
+        chapter MP3s (frame-level copies of the synthesized chunks) are
+        decoded in order and encoded in one pass. Needs ffmpeg.
+        """
+        try:
+            fmt = BOOK_FORMATS[book_format]
+            audio_files = [audio_file for audio_file in audio_files if os.path.exists(audio_file['path'])]
+            if not audio_files:
+                return False
+            markers = chapter_markers(audio_files, gap_ms)
+            metadata = tempfile.NamedTemporaryFile(delete=False, suffix='.ffmeta')
+            metadata.close()
+            merge_stats = {}
+            try:
+                write_ffmetadata(metadata.name, markers, title=pdf_filename)
+                with self.metrics.stage("export", scope="book", format=book_format):
+                    self.audio_merger.transcode(
+                        [audio_file['path'] for audio_file in audio_files], output_path,
+                        ["-map", "0:a", "-map_metadata", "1", "-map_chapters", "1"] + fmt["codec"] + fmt["muxer"],
+                        gap_ms=gap_ms, extra_inputs=["-f", "ffmetadata", "-i", metadata.name], stats=merge_stats,
+                    )
+            finally:
+                os.remove(metadata.name)
+            self.last_merge_stats = merge_stats or None
+            self._record_merge(merge_stats, scope="book")
+            
+            # Save to directory
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            saved_filename = f"{pdf_filename}_complete_{timestamp}{fmt['extension']}"
+            self.last_export_path = os.path.join(self.script_dir, saved_filename)
+            _link_or_copy(output_path, self.last_export_path)
+            self.notify("success", f"✅ Complete audiobook saved: {saved_filename} ({len(markers)} chapters)")
+            return True
+        except Exception as e:
+            self.notify("error", f"Error exporting {book_format}: {str(e)}")
             return False
 
+def _file_download_button(st, label, path, file_name, mime, **kwargs):
+    """Download button that reads the file when clicked, not on every rerun"""
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+    return st.download_button(label, data=read, file_name=file_name, mime=mime, on_click="ignore", **kwargs)
+
+def _play_preview(slot, segments, done):
+    """Play published preview segments back to back in one Streamlit audio slot.
+
+    Runs on its own thread while a job generates: each segment replaces the
+    previous one (autoplaying) once that one has had time to finish, so
+    listening keeps going as the playlist grows.
+    """
+    position = 0
+    next_at = 0.0
+    while not done.is_set():
+        if position >= len(segments) or time.monotonic() < next_at:
+            done.wait(0.2)
+            continue
+        segment = segments[position]
+        position += 1
+        try:
+            slot.audio(segment["path"], format="audio/mp3", autoplay=True)
+        except Exception as e:
+            logger.info("Preview playback stopped: %s", e)
+            return
+        next_at = time.monotonic() + (segment["duration"] or 0.0)
+
 def main():
+    import streamlit as st
+    
     st.set_page_config(
         page_title="Fast PDF to Audiobook Converter",
         page_icon="🎙️",
@@ -323,8 +3942,24 @@ def main():
     st.title("🎙️ Fast PDF to Audiobook Converter")
     st.markdown("Convert PDFs to audiobooks quickly with optional voice matching")
     
+    # Initialize session state
+    if 'chapters' not in st.session_state:
+        st.session_state.chapters = []
+    if 'audio_files' not in st.session_state:
+        st.session_state.audio_files = []
+    if 'voice_sample' not in st.session_state:
+        st.session_state.voice_sample = None
+    if 'selected_chapters' not in st.session_state:
+        st.session_state.selected_chapters = []
+    if 'pdf_source' not in st.session_state:
+        st.session_state.pdf_source = None
+    
     # Initialize converter
-    converter = PDFToAudiobook()
+    streamlit_messages = {"success": st.success, "info": st.info,
+                          "warning": st.warning, "error": st.error}
+    converter = PDFToAudiobook(
+        message_callback=lambda level, message: streamlit_messages.get(level, st.info)(message)
+    )
     
     # Display save directory
     st.info(f"📁 Audiobooks will be saved to: **{converter.script_dir}**")
@@ -350,13 +3985,69 @@ def main():
         elif tts_method == "pyttsx3 (Offline - Fastest)":
             voice_settings['rate'] = st.slider("Speech Rate", 150, 250, 180)
         
+        engine_key = normalize_engine_name(tts_method)
+        if engine_key != "pyttsx3":
+            converter.concurrency[engine_key] = st.slider(
+                "Parallel Requests", 1, 16, DEFAULT_TTS_CONCURRENCY[engine_key],
+                help="How many chunks are synthesized at the same time"
+            )
+        else:
+            converter.concurrency[engine_key] = st.slider(
+                "Worker Processes", 1, max(2, os.cpu_count() or 1), DEFAULT_TTS_CONCURRENCY[engine_key],
+                help="Offline engines running side by side, one per process (1 = in-process)"
+            )
+        
+        st.markdown("---")
+        converter.ocr_enabled = st.checkbox(
+            "OCR Scanned Pages", value=True,
+            help="Pages without a text layer are rasterized and read with Tesseract"
+        )
+        if converter.ocr_enabled:
+            converter.ocr_dpi = st.select_slider("OCR DPI", options=[150, 200, 300, 400], value=300)
+            if not ocr_available():
+                st.caption("Tesseract or PyMuPDF not found - OCR will be skipped")
+        
+        st.markdown("---")
+        book_format = st.selectbox(
+            "Complete Audiobook Format", ["mp3", "m4b", "opus"],
+            format_func={"mp3": "MP3 (192k)", "m4b": "M4B (AAC 64k, chapters)",
+                         "opus": "Ogg/Opus (32k, chapters)"}.get,
+            help="M4B and Opus are single files with chapter navigation at speech bitrates (needs ffmpeg)"
+        )
+        
+        st.markdown("---")
+        memory_budget = st.number_input(
+            "Assembly Memory Budget (MB)", min_value=0, value=0, step=256,
+            help="0 = unlimited. Caps memory used when merging very long books"
+        )
+        converter.audio_merger.memory_budget_mb = memory_budget or None
+        
         st.markdown("---")
         enable_voice_matching = st.checkbox("Enable Voice Matching", value=False)
+        stream_preview = st.checkbox(
+            "Stream preview while generating", value=True,
+            help="Start playing the first chunk as soon as it is synthesized"
+        )
         
         if not EDGE_TTS_AVAILABLE:
             st.markdown("---")
             st.info("Install Edge TTS for better quality:")
             st.code("pip install edge-tts")
+        
+        # Jobs interrupted by a crash or a session rerun can be finished later
+        unfinished_jobs = [job for job in converter.list_jobs() if job['status'] != 'completed']
+        if unfinished_jobs:
+            st.markdown("---")
+            st.subheader("♻️ Resume Job")
+            resume_job_id = st.selectbox("Unfinished jobs", [job['job_id'] for job in unfinished_jobs])
+            if st.button("Resume"):
+                with st.spinner(f"Resuming {resume_job_id}..."):
+                    try:
+                        st.session_state.audio_files = converter.resume(resume_job_id)
+                    finally:
+                        # The converter is rebuilt on every rerun: don't leave its workers behind
+                        converter.close()
+                st.success(f"Resumed {resume_job_id}: {len(st.session_state.audio_files)} chapter(s) ready")
     
     # Main content
     col1, col2 = st.columns([1, 1])
@@ -374,10 +4065,10 @@ def main():
                 st.success("✅ Voice sample uploaded!")
                 st.audio(voice_sample)
                 
-                temp_voice = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-                temp_voice.write(voice_sample.read())
-                temp_voice.close()
-                st.session_state.voice_sample = temp_voice.name
+                # Stored once per distinct sample, not on every rerun
+                st.session_state.voice_sample = converter.save_upload(
+                    voice_sample.getvalue(), os.path.splitext(voice_sample.name)[1] or '.wav'
+                )
         
         st.header(f"{'2️⃣' if enable_voice_matching else '1️⃣'} Upload PDF")
         pdf_file = st.file_uploader("Choose PDF file", type="pdf")
@@ -386,10 +4077,16 @@ def main():
             st.success(f"✅ PDF uploaded: {pdf_file.name}")
             pdf_filename = pdf_file.name.replace('.pdf', '')
             
-            if st.button("📖 Extract Text", type="primary"):
-                with st.spinner("Extracting text..."):
-                    chapters = converter.extract_text_from_pdf(pdf_file)
+            if st.button("📖 Find Chapters", type="primary"):
+                with st.spinner("Reading chapter index..."):
+                    # Only titles and page ranges; text is extracted later for the selected chapters
+                    try:
+                        chapters = converter.chapter_index(pdf_file)
+                    except Exception as e:
+                        st.error(f"Error reading PDF: {str(e)}")
+                        chapters = []
                     st.session_state.chapters = chapters
+                    st.session_state.pdf_source = pdf_file.getvalue()
                     st.session_state.selected_chapters = list(range(len(chapters)))
                     st.success(f"Found {len(chapters)} chapter(s)!")
     
@@ -413,7 +4110,7 @@ def main():
             # Show chapters
             for idx, chapter in enumerate(st.session_state.chapters):
                 is_selected = st.checkbox(
-                    f"{chapter['title']} ({len(chapter['content'])} chars)",
+                    f"{chapter['title']} (pages {chapter['start'] + 1}-{chapter['stop']})",
                     value=idx in st.session_state.selected_chapters,
                     key=f"ch_{idx}"
                 )
@@ -429,60 +4126,123 @@ def main():
                 if st.button(f"🎙️ Generate {selected_count} Chapter(s)", type="primary"):
                     progress_bar = st.progress(0)
                     status_text = st.empty()
+                    preview_slot = st.empty()
+                    preview_text = st.empty()
+                    # Published segments, played in order by a player thread until the job ends
+                    preview_segments = []
+                    preview_done = threading.Event()
+                    preview_player = threading.Thread(
+                        target=_play_preview, args=(preview_slot, preview_segments, preview_done),
+                        name="preview-player", daemon=True
+                    )
+                    if stream_preview:
+                        _attach_streamlit_context(preview_player)
+                        preview_player.start()
                     
-                    selected_chapters_list = [st.session_state.chapters[i] 
-                                             for i in sorted(st.session_state.selected_chapters)]
+                    def show_preview(segment):
+                        preview_segments.append(segment)
+                        first_audio = converter.last_preview.first_audio_seconds
+                        preview_text.caption(
+                            f"🎧 {segment['index'] + 1} chunk(s) ready · first audio after {first_audio:.1f}s "
+                            f"· {segment['title'] or ''} · playlist: {segment['playlist']}"
+                        )
                     
                     with st.spinner(f"Generating audio for {selected_count} chapter(s)..."):
-                        audio_files = converter.process_chapters_fast(
-                            selected_chapters_list,
-                            st.session_state.voice_sample if enable_voice_matching else None,
-                            tts_method=tts_method.split()[0],
-                            voice_settings=voice_settings,
-                            progress_callback=lambda p, t: (progress_bar.progress(p), status_text.text(t)),
-                            pdf_filename=pdf_filename
-                        )
+                        # Selected chapters are extracted while earlier ones are synthesized
+                        try:
+                            audio_files = converter.process_chapters_fast(
+                                st.session_state.pdf_source,
+                                st.session_state.voice_sample if enable_voice_matching else None,
+                                tts_method=tts_method.split()[0],
+                                voice_settings=voice_settings,
+                                progress_callback=lambda p, t: (progress_bar.progress(p), status_text.text(t)),
+                                pdf_filename=pdf_filename,
+                                selected_chapters=sorted(st.session_state.selected_chapters),
+                                preview_callback=show_preview if stream_preview else None
+                            )
+                        finally:
+                            # The finished chapters and book take over; the last segment keeps playing
+                            preview_done.set()
+                            if preview_player.is_alive():
+                                preview_player.join()
+                            # The converter is rebuilt on every rerun: don't leave its workers behind
+                            converter.close()
                         
                         st.session_state.audio_files = audio_files
                         
                         if audio_files:
                             st.balloons()
                             st.success(f"🎉 Generated {len(audio_files)} audio file(s)!")
+                            if converter.last_pipeline is not None:
+                                with st.expander("⏱️ Pipeline stages"):
+                                    st.json(converter.last_pipeline.stage_stats())
+                            with st.expander("📈 Run metrics"):
+                                st.json(converter.metrics.snapshot())
+                                metrics_col1, metrics_col2 = st.columns(2)
+                                with metrics_col1:
+                                    st.download_button("JSON report", converter.metrics.to_json(),
+                                                       file_name=f"{pdf_filename}_metrics.json",
+                                                       mime="application/json")
+                                with metrics_col2:
+                                    st.download_button("Prometheus", converter.metrics.to_prometheus(),
+                                                       file_name=f"{pdf_filename}_metrics.prom",
+                                                       mime="text/plain")
+                            if converter.last_boilerplate_stats and converter.last_boilerplate_stats["chars_removed"]:
+                                boilerplate_stats = converter.last_boilerplate_stats
+                                st.caption(
+                                    f"✂️ Skipped {boilerplate_stats['chars_removed']:,} characters of running "
+                                    f"headers, footers and page numbers ({boilerplate_stats['removed_share']:.1%})"
+                                )
+                            if converter.chunk_cache is not None:
+                                cache_stats = converter.chunk_cache.stats()
+                                st.caption(
+                                    f"♻️ TTS cache: {cache_stats['hits']} hit(s), "
+                                    f"{cache_stats['misses']} miss(es) "
+                                    f"({cache_stats['hit_rate']:.0%} reused)"
+                                )
                             
-                            # Merge if multiple chapters
-                            if len(audio_files) > 1:
-                                output_path = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-                                output_path.close()
-                                
-                                if converter.merge_audio_files_fast(audio_files, output_path.name, pdf_filename):
-                                    with open(output_path.name, 'rb') as f:
-                                        audio_bytes = f.read()
-                                    
-                                    st.download_button(
-                                        label="⬇️ Download Complete Audiobook",
-                                        data=audio_bytes,
-                                        file_name=f"{pdf_filename}_complete.mp3",
-                                        mime="audio/mp3",
+                            # Merge if multiple chapters (M4B/Opus books are always one file)
+                            if len(audio_files) > 1 or book_format != "mp3":
+                                extension = BOOK_FORMATS[book_format]["extension"] if book_format != "mp3" else ".mp3"
+                                mime = BOOK_FORMATS[book_format]["mime"] if book_format != "mp3" else "audio/mp3"
+                                # Encoded in a scratch directory, published to script_dir by hard link
+                                scratch = converter.workspace().job()
+                                output_path = scratch.temp_path(extension, prefix='book_')
+                                try:
+                                    if book_format == "mp3":
+                                        merged = converter.merge_audio_files_fast(audio_files, output_path,
+                                                                                  pdf_filename)
+                                    else:
+                                        merged = converter.export_audiobook(audio_files, output_path, pdf_filename,
+                                                                            book_format=book_format)
+                                finally:
+                                    scratch.cleanup()
+                                if merged:
+                                    merge_stats = converter.last_merge_stats
+                                    st.caption(
+                                        f"🧮 Merged by {merge_stats['method']} in {merge_stats['seconds']:.1f}s, "
+                                        f"peak memory {merge_stats['peak_rss_bytes'] / 2 ** 20:.0f} MB"
+                                    )
+                                    _file_download_button(
+                                        st, "⬇️ Download Complete Audiobook", converter.last_export_path,
+                                        file_name=f"{pdf_filename}_complete{extension}",
+                                        mime=mime,
                                         type="primary"
                                     )
                                     
-                                    st.audio(audio_bytes, format='audio/mp3')
+                                    st.audio(converter.last_export_path, format=mime)
                             else:
                                 # Single chapter
                                 audio_file = audio_files[0]
                                 if os.path.exists(audio_file['path']):
-                                    with open(audio_file['path'], 'rb') as f:
-                                        audio_bytes = f.read()
-                                    
-                                    st.download_button(
-                                        label=f"⬇️ Download {audio_file['title']}",
-                                        data=audio_bytes,
+                                    _file_download_button(
+                                        st, f"⬇️ Download {audio_file['title']}", audio_file['path'],
                                         file_name=f"{pdf_filename}_{audio_file['title']}.mp3",
                                         mime="audio/mp3",
                                         type="primary"
                                     )
                                     
-                                    st.audio(audio_bytes, format='audio/mp3')
+                                    st.audio(audio_file['path'], format='audio/mp3')
     
     # Individual downloads
     if st.session_state.audio_files:
@@ -493,14 +4253,12 @@ def main():
         for idx, audio_file in enumerate(st.session_state.audio_files):
             with cols[idx % 3]:
                 if os.path.exists(audio_file['path']):
-                    with open(audio_file['path'], 'rb') as f:
-                        st.download_button(
-                            label=f"📥 {audio_file['title']}",
-                            data=f.read(),
-                            file_name=f"{audio_file['title']}.mp3",
-                            mime="audio/mp3",
-                            key=f"dl_{idx}"
-                        )
+                    _file_download_button(
+                        st, f"📥 {audio_file['title']}", audio_file['path'],
+                        file_name=f"{audio_file['title']}.mp3",
+                        mime="audio/mp3",
+                        key=f"dl_{idx}"
+                    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
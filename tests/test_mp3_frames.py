@@ -0,0 +1,64 @@
+import math
+import struct
+import wave
+
+import book_voice_studio as bvs
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono
+HEADER = bytes((0xFF, 0xF3, 0x64, 0xC4))
+
+
+def _silent_frame():
+    return bvs.make_silent_mp3_frame(bvs.parse_mp3_header(HEADER))
+
+
+def _write_speech_wav(path, seconds=2.0, sample_rate=22050):
+    """A WAV whose samples contain bytes that parse as MP3 frame headers"""
+    samples = []
+    for idx in range(int(seconds * sample_rate)):
+        value = 8000 * math.sin(idx * 0.07) * math.sin(idx * 0.0011) + 900 * math.sin(idx * 1.3)
+        samples.append(struct.pack("<h", int(value)))
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"".join(samples))
+        # A lone header-like run inside the sample data
+        wav.writeframes(HEADER * 2)
+
+
+def test_wav_named_mp3_is_not_parsed_as_frames(tmp_path):
+    path = tmp_path / "chunk.mp3"
+    _write_speech_wav(path)
+    assert bvs.probe_mp3(str(path)) is None
+    assert list(bvs.iter_mp3_frames(str(path))) == []
+    assert abs(bvs.audio_duration(str(path)) - 2.0) < 0.01
+    assert bvs._probe_audio_format(str(path)) == (22050, 1)
+
+
+def test_raw_pcm_without_container_needs_chained_frames(tmp_path):
+    wav_path = tmp_path / "chunk.wav"
+    _write_speech_wav(wav_path)
+    raw_path = tmp_path / "raw.mp3"
+    raw_path.write_bytes(wav_path.read_bytes()[44:])
+    assert bvs.probe_mp3(str(raw_path)) is None
+
+
+def test_sync_skips_false_header_before_real_frames(tmp_path):
+    frame = _silent_frame()
+    path = tmp_path / "book.mp3"
+    path.write_bytes(HEADER[:3] + b"junk" + HEADER + b"\x00" * 7 + frame * 50)
+    frames = list(bvs.iter_mp3_frames(str(path), block_size=4096))
+    assert len(frames) == 50
+    assert all(data == frame for _, data in frames)
+    info = bvs.parse_mp3_header(HEADER)
+    assert abs(bvs.audio_duration(str(path)) - 50 * info.samples / info.sample_rate) < 1e-9
+
+
+def test_short_streams_ending_cleanly_are_accepted(tmp_path):
+    frame = _silent_frame()
+    path = tmp_path / "short.mp3"
+    for count in (1, 2, 3):
+        path.write_bytes(frame * count)
+        assert len(list(bvs.iter_mp3_frames(str(path), block_size=1000))) == count
+
@@ -0,0 +1,13 @@
+import pytest
+
+from book_voice_studio import PAGE_NUMBER_RE
+
+
+@pytest.mark.parametrize("line", ["12", "- 12 -", "Page 3 of 40", "12/300", "xiv", "iii", "- x -", "xl", "cxc"])
+def test_page_numbers_match(line):
+    assert PAGE_NUMBER_RE.match(line)
+
+
+@pytest.mark.parametrize("line", ["did", "mild.", "civil.", "mix", "di", "vivid", "ill", "I", "livid."])
+def test_words_made_of_roman_letters_do_not_match(line):
+    assert not PAGE_NUMBER_RE.match(line)
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import book_voice_studio as bvs
+from bench_audiobook import HTTPTTSEngine, StandInTTSServer
+
+
+class RecordingScheduler(bvs.RequestScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limits = []
+
+    def _leave(self, outcome):
+        super()._leave(outcome)
+        self.limits.append(self.limit)
+
+
+def _run(scheduler, engine, tmp_path, prefix, count):
+    def one(i):
+        text = f"Chunk {prefix}{i} of the stand-in book, long enough for a few frames of audio."
+        return scheduler.call(engine, text, str(tmp_path / f"{prefix}{i}.mp3"), None)
+
+    with ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as pool:
+        return list(pool.map(one, range(count)))
+
+
+def test_retries_and_aimd_against_the_stand_in_server(tmp_path):
+    with StandInTTSServer(latency=0.005, throttle_share=0.25, error_share=0.1, seed=7) as server:
+        engine = HTTPTTSEngine(server.url, timeout=10)
+        scheduler = RecordingScheduler("Stand-in", max_concurrency=8, retries=12, backoff=0.02, max_backoff=0.3)
+
+        results = _run(scheduler, engine, tmp_path, "noisy", 60)
+        assert all(ok for ok, attempts, error in results)
+        assert server.counts[429] and server.counts[500]
+        assert scheduler.stats["retries"] >= server.counts[429] + server.counts[500]
+        assert scheduler.stats["failed"] == 0
+        assert min(scheduler.limits) < scheduler.max_concurrency
+
+        # Once the service stops failing the window grows back to the cap
+        server.throttle_share = server.error_share = 0.0
+        results = _run(scheduler, engine, tmp_path, "clean", 80)
+        assert all(ok for ok, attempts, error in results)
+        assert scheduler.limit == scheduler.max_concurrency
+
+    for ok, attempts, error in results:
+        assert attempts == 1 and error is None
+    assert all((tmp_path / f"clean{i}.mp3").stat().st_size > 0 for i in range(80))
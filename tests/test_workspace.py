@@ -0,0 +1,78 @@
+import os
+import time
+
+import book_voice_studio as bvs
+
+HEADER = bytes((0xFF, 0xF3, 0x64, 0xC4))
+FRAME = bvs.make_silent_mp3_frame(bvs.parse_mp3_header(HEADER))
+
+
+def _converter(tmp_path, fail):
+    converter = bvs.PDFToAudiobook(cache_dir=str(tmp_path / "cache"), cache_size_mb=0)
+    converter.script_dir = str(tmp_path / "out")
+    os.makedirs(converter.script_dir, exist_ok=True)
+
+    def synthesize(text, output_path, voice_settings):
+        if fail:
+            return False
+        with open(output_path, "wb") as f:
+            f.write(FRAME * 20)
+        return True
+
+    converter.register_engine("Stub", synthesize, concurrency=1)
+    return converter
+
+
+def _backdate(path, hours):
+    stamp = time.time() - hours * 3600
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames + dirnames:
+            os.utime(os.path.join(dirpath, name), (stamp, stamp))
+    os.utime(path, (stamp, stamp))
+
+
+def _failed_job(tmp_path):
+    converter = _converter(tmp_path, fail=True)
+    chapters = [{"title": "One", "content": "A short chapter. It has two sentences."}]
+    converter.process_chapters_fast(chapters, None, tts_method="Stub")
+    return converter.last_job_id
+
+
+def test_resume_keeps_a_stale_job(tmp_path):
+    job_id = _failed_job(tmp_path)
+    converter = _converter(tmp_path, fail=False)
+    job_dir = os.path.join(converter.jobs_dir, job_id)
+    _backdate(job_dir, converter.workspace_max_age_hours + 8)
+
+    audio_files = converter.resume(job_id)
+
+    assert len(audio_files) == 1
+    assert os.path.exists(audio_files[0]["path"])
+
+
+def test_opening_a_job_never_evicts_it(tmp_path):
+    other_id = _failed_job(tmp_path)
+    job_id = _failed_job(tmp_path)
+    converter = _converter(tmp_path, fail=False)
+    job_dir = os.path.join(converter.jobs_dir, job_id)
+    # Room for this job only; it is the oldest, so plain LRU would drop it first
+    _backdate(job_dir, 1)
+    workspace = converter.workspace()
+    converter.workspace_quota_mb = (workspace._usage(job_dir, set()) + 64) / 2 ** 20
+
+    converter.workspace().job(job_id).release()
+
+    assert os.path.exists(os.path.join(job_dir, "manifest.json"))
+    assert not os.path.exists(os.path.join(converter.jobs_dir, other_id))
+
+
+def test_list_jobs_skips_jobs_due_for_eviction(tmp_path):
+    job_id = _failed_job(tmp_path)
+    converter = _converter(tmp_path, fail=False)
+    assert [job["job_id"] for job in converter.list_jobs()] == [job_id]
+
+    _backdate(os.path.join(converter.jobs_dir, job_id), converter.workspace_max_age_hours + 8)
+    assert converter.list_jobs() == []
+
+    converter.workspace().job()
+    assert not os.path.exists(os.path.join(converter.jobs_dir, job_id))